@@ -1,28 +1,38 @@
 # encoding: utf-8
 
-import backoff
-import base64
 import datetime
+import hashlib
 import json
-import requests
-
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email.mime.text import MIMEText
-
-from google.oauth2.credentials import Credentials
-from googleapiclient import discovery
-from googleapiclient.errors import HttpError
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+import uuid
 
-from sqlalchemy_utils import database_exists
+from concurrent.futures import ProcessPoolExecutor
 
-from bs4 import BeautifulSoup
+import requests
+from sqlalchemy.exc import IntegrityError, OperationalError
 
+from app.config import Config
+from app.crawler import Crawler
 from app.database import Database
+from app.email_body import FragmentCache
 from app.event import Event
+from app.event_registry import EventRegistry
 from app.logger import Logger
+from app.metrics import Profiler, metrics
+from app.outbox import Outbox
+from app.parser import Parser
+from app.poll_schedule import PollSchedule
+from app.sharding import crawl_worker, shard_of
+from app.subscriptions import SubscriptionIndex
+from app.ticket_watcher import TicketWatcher
 from app.user import User
 
+GMAIL_DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/gmail/v1/rest"
+
 
 class App:
     DEBUG = False
@@ -32,70 +42,461 @@ class App:
     else:
         CONFIG_PATH = "config.json"
 
-    with open(CONFIG_PATH) as f:
-        CONFIG = json.load(f)
+    CONFIG = Config(CONFIG_PATH)
 
     logger = Logger.get(__name__)
 
-    def main(self):
+    def __init__(self, config=None):
+        if config is not None:
+            self.CONFIG = config
+        self.service = None
+        self.crawler = Crawler.from_config(self.CONFIG)
+        self.parser = Parser.from_config(self.CONFIG)
+        self.profiler = Profiler.from_config(self.CONFIG)
+        self.registry = EventRegistry()
+
+    def connect(self):
+        from sqlalchemy_utils import database_exists
+
         if not database_exists(self.CONFIG["database_url"]):
             self.logger.info("Creating new database")
             Database.init_db(self.CONFIG["database_url"])
         self.logger.info("Connecting to the database")
-        db = Database.from_url(self.CONFIG["database_url"])
+        return Database.from_url(self.CONFIG["database_url"])
 
+    def main(self, shards=None):
+        db = self.connect()
         users = self.update_users_preferences(db)
+        if shards:
+            self.run_sharded(db, users, shards)
+        else:
+            self.run(db, users)
+        self.export_metrics()
+
+    def daemon(self):
+        # Keeps the database session, HTTP pool and config warm and checks
+        # each entity whenever its own polling interval has passed.
+        db = self.connect()
+        schedule = PollSchedule.from_config(self.CONFIG)
+        watcher = TicketWatcher.from_config(self.CONFIG)
+        preferences_interval = self.CONFIG.get("preferences_interval", 21600)
+        max_sleep = self.CONFIG.get("daemon_max_sleep", 60)
+        users = None
+        refreshed_at = None
+
+        while True:
+            try:
+                now = time.monotonic()
+                if users is None or now - refreshed_at >= preferences_interval:
+                    users = self.update_users_preferences(db)
+                    refreshed_at = now
+
+                entities = self.get_entities(db)
+                due = schedule.due(entities, now)
+                if due:
+                    self.logger.info(f"{len(due)} of {len(entities)} entities are due")
+                    self.run(db, users, due, schedule, watched=True)
+                self.watch_tickets(db, users, watcher)
+            except Exception:
+                self.logger.exception("Run failed, retrying on the next tick")
+                db.rollback()
+                entities = []
+            self.export_metrics()
+
+            delay = schedule.next_check(entities, time.monotonic()) - time.monotonic()
+            time.sleep(min(max(delay, 1), max_sleep))
+
+    def benchmark(self, runs, shards=None):
+        # Each run starts from an empty database so that it parses and stores
+        # everything, emails are queued but not sent.
+        self.CONFIG["send_after_run"] = False
+        latencies = metrics.histogram("http_request_seconds")
+
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.monotonic()
+            for run in range(runs):
+                self.CONFIG["database_url"] = f"sqlite:///{directory}/{run}.db"
+                self.main(shards)
+            elapsed = time.monotonic() - start
+
+        results = {
+            "runs_per_second": runs / elapsed,
+            "latency_p50": latencies.quantile(0.5),
+            "latency_p99": latencies.quantile(0.99),
+            "pages_per_run": metrics.counters.get("pages_fetched", 0) / runs,
+            "db_queries_per_run": metrics.counters.get("db_queries", 0) / runs,
+        }
+        self.logger.info(
+            f"Benchmark: {runs} runs in {elapsed:.2f}s, "
+            f"{results['runs_per_second']:.3f} runs/s, "
+            f"page latency p50 {results['latency_p50']:.3f}s "
+            f"p99 {results['latency_p99']:.3f}s, "
+            f"{results['pages_per_run']:.0f} pages and "
+            f"{results['db_queries_per_run']:.0f} DB queries per run"
+        )
+        return results
+
+    def get_entities(self, db):
+        entities = []
+        for entity_type in ("venue", "artist", "promoter"):
+            for entity in db.get_distinctive_items(entity_type):
+                entity["type"] = entity_type
+                entities.append(entity)
+        return entities
+
+    def start_job(self, db):
+        return db.start_crawl_job(
+            datetime.datetime.utcnow(),
+            datetime.timedelta(hours=self.CONFIG.get("crawl_resume_max_age_hours", 6)),
+        )
 
-        venues = db.get_distinctive_items("venue")
-        artists = db.get_distinctive_items("artist")
-        promoters = db.get_distinctive_items("promoter")
+    def run(self, db, users, entities=None, schedule=None, watched=False):
+        self.registry = EventRegistry()
+
+        job = self.start_job(db)
+        completed = db.completed_entities(job.id)
+
+        if entities is None:
+            entities = self.get_entities(db)
+        if completed:
+            entities = [
+                entity
+                for entity in entities
+                if (entity["type"], entity["tag"]) not in completed
+            ]
+            self.logger.info(f"Skipping {len(completed)} entities checked earlier")
+
+        self.crawl(db, entities, job, schedule, watched)
+        self.log_stats()
+        self.finish_run(db, users, job)
+
+    def run_sharded(self, db, users, shards):
+        # Entities are split into shards by tag and crawled by worker
+        # processes, which may also run on other nodes against the same
+        # database. Their new events meet in the job's pending events.
+        job = self.start_job(db)
+        shards = db.create_shards(job.id, shards)
+        workers = self.CONFIG.get("crawl_workers", min(shards, os.cpu_count() or 1))
+
+        if workers:
+            self.logger.info(f"Crawling {shards} shards with {workers} processes")
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(workers, mp_context=context) as pool:
+                # The local workers share each host's rate limit.
+                config = dict(self.CONFIG.load(), local_workers=workers)
+                futures = [pool.submit(crawl_worker, config) for _ in range(workers)]
+                for future in futures:
+                    future.result()
+
+        # Workers on other nodes may still be busy with their last shard. One
+        # that died leaves its shard running until the lease runs out, it is
+        # then crawled here.
+        while True:
+            self.crawl_shards(db, job)
+            if not db.count_unfinished_shards(job.id):
+                break
+            db.commit()
+            time.sleep(self.CONFIG.get("shard_poll_interval", 5))
+
+        self.finish_run(db, users, job)
+
+    def crawl_worker(self):
+        db = self.connect()
+        job = db.running_crawl_job()
+        if job is None:
+            self.logger.info("No crawl job is running")
+            return 0
+
+        crawled = self.crawl_shards(db, job)
+
+        self.log_stats()
+        # Local workers share a directory, each keeps its own files.
+        self.export_metrics(suffix=str(os.getpid()))
+        return crawled
+
+    def crawl_shards(self, db, job):
+        token = uuid.uuid4().hex
+        lease = datetime.timedelta(seconds=self.CONFIG.get("shard_lease", 1800))
+        max_tries = self.CONFIG.get("shard_max_tries", 5)
+        entities = self.get_entities(db)
+        crawled = 0
+
+        while True:
+            now = datetime.datetime.utcnow()
+            shard = db.claim_shard(job.id, token, now, now + lease)
+            if shard is None:
+                break
+            self.logger.info(f"Crawling shard {shard.shard + 1} of {shard.shards}")
+            for attempt in range(1, max_tries + 1):
+                try:
+                    self.crawl_shard(db, job, shard, entities)
+                    break
+                except (IntegrityError, OperationalError) as e:
+                    # Either an event listed in two shards was inserted by
+                    # both, or SQLite gave up waiting for another worker's
+                    # write lock. The batch since the last checkpoint is
+                    # redone, an event stored meanwhile is found in the
+                    # database and still notified only once.
+                    db.rollback()
+                    if attempt == max_tries:
+                        # Given back for the next worker, this one fails.
+                        db.release_shard(shard.id)
+                        db.commit()
+                        raise
+                    self.logger.warning(
+                        f"Shard {shard.shard + 1} failed, retrying: {e}"
+                    )
+                    # Back off a little so busy workers do not retry in
+                    # lockstep.
+                    time.sleep(random.uniform(0, 1))
+            crawled += 1
+        return crawled
+
+    def crawl_shard(self, db, job, shard, entities):
+        completed = db.completed_entities(job.id)
+        shard_entities = [
+            entity
+            for entity in entities
+            if shard_of(entity["tag"], shard.shards) == shard.shard
+            and (entity["type"], entity["tag"]) not in completed
+        ]
+        self.crawl(db, shard_entities, job)
+        db.finish_shard(shard.id)
+        db.commit()
 
-        # go through venues
+    def log_stats(self):
+        self.logger.info(f"HTTP requests: {self.crawler.client.stats()}")
+        self.logger.info(f"Ticket pages: {self.registry.stats()}")
+        if self.crawler.cache is not None:
+            self.logger.info(f"HTTP cache: {self.crawler.cache.stats()}")
+        self.logger.info(f"Counters: {metrics.counters}")
+
+    def export_metrics(self, suffix=None):
+        path = self.CONFIG.get("metrics_path")
+        if path:
+            if suffix is not None:
+                root, extension = os.path.splitext(path)
+                path = f"{root}.{suffix}{extension}"
+            metrics.export(path)
+        self.profiler.dump(suffix)
+
+    def finish_run(self, db, users, job):
+        # Events detected by an interrupted attempt of this job are notified
+        # together with the ones found now.
         new_events = []
+        seen = set()
+        for payload in db.pending_events(job.id):
+            event = Event.from_dict(json.loads(payload))
+            # Shards running at the same time can both see an event's
+            # tickets go on sale.
+            key = (event.event_id, event.event_type)
+            if key not in seen:
+                seen.add(key)
+                new_events.append(event)
 
-        for venue in venues:
-            self.logger.info(f"Checking {venue['name']} venue...")
-
-            venue["type"] = "venue"
-            venue_events = self.get_events(
-                venue, self.CONFIG["venue_url_prefix"] + venue["tag"]
+        # The emails are queued in the same transaction that closes the job,
+        # so a failed send can never lose a notification.
+        self.notify(db, users, new_events)
+        with metrics.stage("db_writes"):
+            db.finish_crawl_job(job, datetime.datetime.utcnow())
+            db.commit()
+
+        if self.CONFIG.get("send_after_run", True):
+            self.send_emails(db)
+
+    def watch(self):
+        db = self.connect()
+        # Follows come from the last preferences update, the watcher should
+        # not wait for every user's favourites page.
+        users = db.load_follows(self.get_users())
+        self.watch_tickets(db, users)
+        self.export_metrics()
+
+    def watch_tickets(self, db, users, watcher=None):
+        if watcher is None:
+            watcher = TicketWatcher.from_config(self.CONFIG)
+        now = datetime.datetime.utcnow()
+        # Each window's most overdue events are enough to find the batch's.
+        candidates = []
+        for first_date, last_date, checked_before in watcher.windows(now):
+            candidates.extend(
+                db.pending_ticket_events(
+                    first_date, last_date, checked_before, watcher.batch_size
+                )
             )
-            new_venue_events = self.add_to_database(db, venue_events)
-            new_events.extend(new_venue_events)
+        due = watcher.due(candidates, now)
+        if not due:
+            return
 
-        for artist in artists:
-            self.logger.info(f"Checking {artist['name']} artist...")
+        self.logger.info(f"Checking {len(due)} events still waiting for tickets")
+        self.registry = EventRegistry()
+        payloads = db.event_payloads([event.id for event in due])
+        events = [Event.from_dict(json.loads(payloads[event.id])) for event in due]
+        new_events = self.add_to_database(db, events)
 
-            artist["type"] = "artist"
-            artist_events = self.get_events(
-                artist, self.CONFIG["artist_url_prefix"] + artist["tag"]
-            )
-            new_artist_events = self.add_to_database(db, artist_events)
-            new_events.extend(new_artist_events)
+        self.notify(db, users, new_events)
+        db.commit()
 
-        for promoter in promoters:
-            self.logger.info(f"Checking {promoter['name']} promoter...")
+        if new_events and self.CONFIG.get("send_after_run", True):
+            self.send_emails(db)
 
-            promoter["type"] = "promoter"
-            promoter_events = self.get_events(
-                promoter, self.CONFIG["promoter_url_prefix"] + promoter["tag"]
-            )
-            new_promoter_events = self.add_to_database(db, promoter_events)
-            new_events.extend(new_promoter_events)
+    def notify(self, db, users, new_events):
+        with metrics.stage("render"):
+            # The same users are notified again by every daemon tick.
+            for user in users:
+                user.reset_email()
+            subscriptions = SubscriptionIndex(users)
+            fragments = FragmentCache()
+            for new_event in new_events:
+                self.add_event_notifications(new_event, subscriptions, fragments)
+            self.enqueue_emails(db, users)
+
+    def prune(self, vacuum=False):
+        db = self.connect()
+        today = datetime.date.today()
+        db.prune_events(
+            today - datetime.timedelta(days=self.CONFIG.get("prune_grace_days", 1)),
+            datetime.datetime.utcnow()
+            - datetime.timedelta(days=self.CONFIG.get("prune_unseen_days", 30)),
+        )
+        if vacuum:
+            db.vacuum()
 
-        db.commit()
+    def crawl(self, db, entities, job=None, schedule=None, watched=False):
+        self.logger.info(f"Fetching {len(entities)} entity pages")
+
+        new_events = []
+        checkpointed = set()
+        seen_at = datetime.datetime.utcnow()
+        batch_size = self.CONFIG.get("checkpoint_batch_size", 50)
+
+        for start in range(0, len(entities), batch_size):
+            # Pages are fetched one batch at a time, so a full crawl never
+            # holds more than a batch of raw HTML.
+            batch = entities[start : start + batch_size]
+            with metrics.stage("listing_crawl"):
+                pages = self.crawler.fetch_all(
+                    [self.entity_url(entity) for entity in batch]
+                )
+            checks = [
+                self.parse_entity(db, entity, html)
+                for entity, html in zip(batch, pages)
+            ]
+            candidates = []
+            for entity, (page, _, events) in zip(batch, checks):
+                if events is None:
+                    events = [] if watched else self.waiting_events(db, entity, page)
+                candidates.append(events)
+
+            # Every ticket page of the batch is fetched before its first
+            # write. SQLite locks the whole database from a transaction's
+            # first write to its commit, which must not wait on the network
+            # while other workers want to write.
+            owners = {}
+            for i, events in enumerate(candidates):
+                for event in events:
+                    owners.setdefault((event.event_id, event.event_type), i)
+            with self.profiler.profile("add_to_database"):
+                to_check = self.fetch_tickets(
+                    db, [event for events in candidates for event in events]
+                )
+                batch_events = self.store_events(db, to_check, seen_at)
+
+            entity_events = [[] for _ in batch]
+            for event in batch_events:
+                entity_events[owners[(event.event_id, event.event_type)]].append(event)
+
+            for entity, (page, digest, events), found in zip(
+                batch, checks, entity_events
+            ):
+                changed = self.store_page(db, entity, page, digest, events, seen_at)
+                changed = changed or bool(found)
+                new_events.extend(found)
+                if schedule is not None:
+                    schedule.record(entity, changed, time.monotonic())
+
+                # Checkpoints are committed together with the events they
+                # found, a restarted job continues from the last batch. Names
+                # stored under the same tag share a page and a checkpoint.
+                if job is not None:
+                    db.add_pending_events(
+                        job.id, [json.dumps(event.to_dict()) for event in found]
+                    )
+                    key = (entity["type"], entity["tag"])
+                    if key not in checkpointed:
+                        checkpointed.add(key)
+                        db.checkpoint_entity(job.id, *key)
+            if job is not None:
+                with metrics.stage("db_writes"):
+                    db.commit()
 
-        for new_event in new_events:
-            self.add_event_notifications(new_event, users)
-        self.send_emails(users)
+        return new_events
+
+    def parse_entity(self, db, entity, html):
+        self.logger.info(f"Checking {entity['name']} {entity['type']}...")
+
+        digest = self.page_digest(html)
+        page = db.fetch_page(entity["type"], entity["tag"])
+
+        # An unchanged page has no new events, only ones still waiting for
+        # tickets. Those are rechecked from their stored payloads, events
+        # stored before payloads existed need one more parse to get theirs.
+        if (
+            page is not None
+            and page.digest == digest
+            and not db.has_unwatched_events(entity["type"], page.event_ids.split(","))
+        ):
+            self.logger.info(f"{entity['name']} {entity['type']} has not changed")
+            return page, digest, None
+
+        # Listed once here so the page's tree is gone before the DB checks.
+        with self.profiler.profile("parse_events"):
+            events = list(self.parse_events(entity, html))
+        return page, digest, events
+
+    def waiting_events(self, db, entity, page):
+        # Without a ticket watcher, as in one-off runs, every run rechecks the
+        # events of unchanged pages that are still waiting for tickets.
+        return [
+            Event.from_dict(json.loads(payload))
+            for payload in db.waiting_event_payloads(
+                entity["type"], page.event_ids.split(",")
+            )
+        ]
+
+    def store_page(self, db, entity, page, digest, events, seen_at):
+        # Returns whether the page changed, events of None mean it did not.
+        if events is None:
+            db.touch_events(entity["type"], page.event_ids.split(","), seen_at)
+            return False
+
+        event_ids = [event.event_id for event in events]
+        db.touch_events(entity["type"], event_ids, seen_at)
+        db.update_page(entity["type"], entity["tag"], digest, event_ids)
+        return page is None or page.digest != digest
+
+    def page_digest(self, html):
+        # Only the event listing is hashed, the rest of the page carries
+        # tokens and ads that change on every request.
+        start = html.find("<article")
+        end = html.rfind("</article>")
+        events_section = html[start:end] if start != -1 else ""
+        return hashlib.sha256(events_section.encode("utf-8")).hexdigest()
+
+    def entity_url(self, entity):
+        return self.CONFIG[entity["type"] + "_url_prefix"] + entity["tag"]
 
     def update_users_preferences(self, db):
-        self.logger.info("Downloading users favourites")
-        users = self.get_users()
-        users = self.download_users_interests(users)
+        with metrics.stage("preferences"):
+            self.logger.info("Downloading users favourites")
+            users = self.get_users()
+            changed = self.download_users_interests(users, db)
 
-        self.logger.info("Updating users database")
-        self.update_database(users, db)
+            self.logger.info(
+                f"Updating {len(changed)} of {len(users)} users in database"
+            )
+            if changed:
+                self.update_database(changed, db)
 
         return users
 
@@ -116,144 +517,216 @@ class App:
 
         return users
 
-    def download_users_interests(self, users):
-        with requests.Session() as s:
-            s.post(self.CONFIG["login_url"], data=self.CONFIG["payload"])
-
-            for user in users:
-                self.logger.info(f"Fetching user {user.nickname} preferences")
-                url = self.CONFIG["profile_url_prefix"] + user.nickname + "/favourites"
-                html = s.get(url)
-                html.encoding = "utf-8"
-                soup = BeautifulSoup(html.text, "html.parser")
-
-                html_artists = soup.find_all("div", class_="fav")
-
-                if html_artists is not None:
-                    for artist in html_artists:
-                        info_tag = artist.find("div", class_="pb2").find("a")
-                        artist_name = info_tag.get_text()
-                        artist_tag = info_tag.get("href")[4:]
-                        user.add_artist(artist_name, artist_tag)
-                else:
-                    self.logger.warning(
-                        f"User {user.nickname} does not follow any artists"
-                    )
-
-                html_venues = soup.find("ul", class_="list venueListing")
-
-                if html_venues is not None:
-                    for venue in html_venues.find_all("li", recursive=False):
-                        info_tag = venue.find_all("a")[1]
-                        venue_name = info_tag.get_text()
-                        venue_tag = info_tag.get("href")[14:]
-                        user.add_venue(venue_name, venue_tag)
-                else:
-                    self.logger.warning(
-                        f"User {user.nickname} does not follow any venues"
-                    )
+    def download_users_interests(self, users, db):
+        self.crawler.login(self.CONFIG["login_url"], self.CONFIG["payload"])
+
+        self.logger.info(f"Fetching {len(users)} users preferences")
+        urls = [
+            self.CONFIG["profile_url_prefix"] + user.nickname + "/favourites"
+            for user in users
+        ]
+        pages = self.crawler.fetch_all(urls)
+        digests = db.favourites_digests([user.nickname for user in users])
+
+        # Users whose follows and locations are unchanged since the last run
+        # keep the follows stored then and are neither parsed nor synced.
+        changed = []
+        unchanged = []
+        for user, html in zip(users, pages):
+            soup = self.parser.favourites(html)
+            digest = self.favourites_digest(user, soup)
+            if digests.get(user.nickname) == digest:
+                unchanged.append(user)
+                continue
+            user.favourites_digest = digest
+            self.parse_favourites(user, soup)
+            changed.append(user)
+
+        db.load_follows(unchanged)
+        return changed
+
+    def favourites_digest(self, user, soup):
+        # Only the blocks parse_favourites reads are hashed, the rest of the
+        # profile page changes on every request.
+        snapshot = json.dumps([user.locations, str(soup)])
+        return hashlib.sha256(snapshot.encode("utf-8")).hexdigest()
+
+    def parse_favourites(self, user, soup):
+        self.logger.info(f"Parsing user {user.nickname} preferences")
+
+        html_artists = soup.find_all("div", class_="fav")
+
+        if html_artists is not None:
+            for artist in html_artists:
+                info_tag = artist.find("div", class_="pb2").find("a")
+                artist_name = info_tag.get_text()
+                artist_tag = info_tag.get("href")[4:]
+                user.add_artist(artist_name, artist_tag)
+        else:
+            self.logger.warning(f"User {user.nickname} does not follow any artists")
+
+        html_venues = soup.find("ul", class_="list venueListing")
+
+        if html_venues is not None:
+            for venue in html_venues.find_all("li", recursive=False):
+                info_tag = venue.find_all("a")[1]
+                venue_name = info_tag.get_text()
+                venue_tag = info_tag.get("href")[14:]
+                user.add_venue(venue_name, venue_tag)
+        else:
+            self.logger.warning(f"User {user.nickname} does not follow any venues")
 
-                try:
-                    try:
-                        html_promoters = soup.find_all(
-                            lambda tag: tag.name == "ul"
-                            and tag.get("class") == ["list"]
-                        )[1]
-                    except Exception:
-                        # if find_all doesn't succeed, it means the person does not
-                        # follow any labels and only promoters are available
-                        html_promoters = soup.find(
-                            lambda tag: tag.name == "ul"
-                            and tag.get("class") == ["list"]
-                        )
-
-                    for promoter in html_promoters.find_all("li", recursive=False):
-                        info_tag = promoter.find_all("a")[1]
-                        promoter_name = info_tag.get_text()
-                        promoter_tag = info_tag.get("href")[18:]
-                        user.add_promoter(promoter_name, promoter_tag)
-                except Exception:
-                    self.logger.warning(
-                        f"User {user.nickname} does not follow any promoters"
-                    )
+        try:
+            try:
+                html_promoters = soup.find_all(
+                    lambda tag: tag.name == "ul" and tag.get("class") == ["list"]
+                )[1]
+            except Exception:
+                # if find_all doesn't succeed, it means the person does not
+                # follow any labels and only promoters are available
+                html_promoters = soup.find(
+                    lambda tag: tag.name == "ul" and tag.get("class") == ["list"]
+                )
 
-        return users
+            for promoter in html_promoters.find_all("li", recursive=False):
+                info_tag = promoter.find_all("a")[1]
+                promoter_name = info_tag.get_text()
+                promoter_tag = info_tag.get("href")[18:]
+                user.add_promoter(promoter_name, promoter_tag)
+        except Exception:
+            self.logger.warning(f"User {user.nickname} does not follow any promoters")
 
     def update_database(self, users, db):
-        for user in users:
-            db.update_user(user)
+        db.update_users(users)
 
-    def get_events(self, entity, url):
-        html = requests.get(url)
-        html.encoding = "utf-8"
-
-        soup = BeautifulSoup(html.text, "html.parser")
-
-        events_html = soup.find_all("article", class_="event-item")
-
-        events = []
-
-        for event_html in events_html:
+    def parse_events(self, entity, html):
+        # Events are yielded as they are parsed, the page's tree is freed as
+        # soon as the last one has been read.
+        for event_html in self.parser.events(html):
             try:
-                if entity["type"] is "venue":
+                if entity["type"] == "venue":
                     event = Event.from_venue_html(entity["name"], event_html)
-                elif entity["type"] is "artist":
+                elif entity["type"] == "artist":
                     event = Event.from_artist_html(entity["name"], event_html)
-                elif entity["type"] is "promoter":
+                elif entity["type"] == "promoter":
                     event = Event.from_promoter_html(entity["name"], event_html)
             except:
                 self.logger.warning(
                     f"Could not generate event from the following html: {event_html.get_text()}"
                 )
-            events.append(event)
-
-        return events
-
-    def add_to_database(self, db, events):
-        new_events = []
+                continue
+            yield event
+
+    def add_to_database(self, db, events, seen_at=None):
+        # Events may come straight from parse_events and are read twice.
+        to_check = self.fetch_tickets(db, list(events))
+        return self.store_events(db, to_check, seen_at)
+
+    def fetch_tickets(self, db, events):
+        # Decide which events need a ticket check first, so that all of their
+        # event pages can be fetched at once instead of between DB lookups.
+        to_check = []
+        seen = set()
+        events_in_database = db.fetch_events(
+            (event.event_id, event.event_type) for event in events
+        )
 
         for event in events:
-            event_in_database = db.fetch_from_database(event.event_id, event.event_type)
+            key = (event.event_id, event.event_type)
+            if key in seen:
+                continue
+            seen.add(key)
+
+            event_in_database = events_in_database.get(key)
 
             if event_in_database is not None and event_in_database.tickets_available:
                 continue
 
-            event.tickets = self.get_tickets(event.event_url)
+            to_check.append((event, event_in_database))
+
+        # Ticket pages are shared by every event type the event appears under.
+        to_fetch = []
+        fetching = set()
+        for event, _ in to_check:
+            if event.event_id in self.registry or event.event_id in fetching:
+                self.registry.avoided()
+                continue
+            fetching.add(event.event_id)
+            to_fetch.append(event)
+
+        with metrics.stage("ticket_fetch"):
+            pages = self.crawler.fetch_all([event.event_url for event in to_fetch])
+        for event, html in zip(to_fetch, pages):
+            self.registry.add(event.event_id, self.parse_tickets(event.event_url, html))
+        return to_check
+
+    def store_events(self, db, to_check, seen_at=None):
+        new_events = []
+        added = []
+        updated = []
+        checked_at = datetime.datetime.utcnow()
+
+        for event, event_in_database in to_check:
+            event.tickets = self.registry.get(event.event_id)
             tickets_available = (True, False)[not event.tickets]
+            # The payload lets the ticket watcher notify about the event
+            # without its listing page.
+            payload = json.dumps(event.to_dict())
 
             # If event is not in db, add
 
             if event_in_database is None:
-                db.add_event(event.event_id, event.event_type, tickets_available)
+                added.append(
+                    {
+                        "event_id": event.event_id,
+                        "event_type": event.event_type,
+                        "tickets_available": tickets_available,
+                        "event_date": event.parsed_date(),
+                        "last_seen": seen_at or checked_at,
+                        "last_checked": checked_at,
+                        "payload": payload,
+                    }
+                )
                 self.logger.info(
                     f"NEW EVENT WITH URL {event.event_url} IS ADDED TO THE DATABASE. TICKETS: {tickets_available}"
                 )
                 new_events.append(event)
             # The event was in database but didn't have tickets
             else:
+                updated.append(
+                    {
+                        "id": event_in_database.id,
+                        "tickets_available": tickets_available,
+                        "last_checked": checked_at,
+                        "payload": payload,
+                    }
+                )
                 if tickets_available:
-                    db.update_event(event.event_id, event.event_type, tickets_available)
                     self.logger.info(
                         f"EVENT WITH URL {event.event_url} WAS UPDATED WITH TICKETS"
                     )
                     new_events.append(event)
 
-        return new_events
+        with metrics.stage("db_writes"):
+            db.add_events(added)
+            db.update_events(updated)
+        metrics.inc("new_events", len(new_events))
 
-    def get_tickets(self, event_url):
-        html = requests.get(event_url)
-        html.encoding = "utf-8"
-        soup = BeautifulSoup(html.text, "html.parser")
+        return new_events
 
+    def parse_tickets(self, event_url, html):
         tickets = []
         try:
-            html_tickets = soup.find_all("li", class_="onsale but")
+            html_tickets = self.parser.tickets(html)
 
             for html_ticket in html_tickets:
                 p = html_ticket.find("p")
+                # A NavigableString would keep the whole page's tree alive
+                # for as long as the registry holds the tickets.
+                name = p.find(text=True, recursive=False)
                 tickets.append(
                     {
-                        "name": p.find(text=True, recursive=False),
+                        "name": str(name) if name is not None else None,
                         "price": p.find("span").get_text(),
                     }
                 )
@@ -262,30 +735,61 @@ class App:
 
         return tickets
 
-    def add_event_notifications(self, event, users):
-        for user in users:
-            user.add_to_email(event)
+    def add_event_notifications(self, event, subscriptions, fragments):
+        for user in subscriptions.get(event):
+            user.add_to_email(fragments.get(event))
 
-    def send_emails(self, users):
-        service = discovery.build("gmail", "v1", credentials=self.make_credentials())
+    def enqueue_emails(self, db, users):
+        outbox = Outbox.from_config(db, self.CONFIG)
 
         for user in users:
             if user.number_of_new_events == 0:
                 continue
             user.add_email_ending()
-            self.logger.info(f"Emailing {user.email}")
-            message = MIMEMultipart()
-            message["From"] = "me"
-            message["Subject"] = "New events on RA"
-            message["To"] = user.email
-            message.attach(MIMEText(user.email_body.get(), "html"))
-            raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-            body = {"raw": raw_message}
-            self.send_email_request(service, body)
-
-        return
+            outbox.enqueue(user.email, user.email_body.get())
+
+    def send_emails(self, db=None):
+        if db is None:
+            db = self.connect()
+        with metrics.stage("send"):
+            Outbox.from_config(db, self.CONFIG).drain(self.make_service)
+
+        failed = db.count_failed_messages()
+        if failed:
+            self.logger.error(f"{failed} emails could not be sent")
+
+    def make_service(self):
+        # Built once per App, from a local copy of the discovery document
+        # instead of downloading it every run.
+        if self.service is None:
+            from googleapiclient import discovery
+
+            self.service = discovery.build_from_document(
+                self.gmail_discovery_document(), credentials=self.make_credentials()
+            )
+        return self.service
+
+    def gmail_discovery_document(self):
+        path = self.CONFIG.get("gmail_discovery_path", "gmail_discovery.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                return f.read()
+
+        # Not through the crawler's client, whose rate limiting, retries and
+        # replay are meant for RA.
+        self.logger.info("Downloading the Gmail discovery document")
+        response = requests.get(GMAIL_DISCOVERY_URL, timeout=30)
+        response.raise_for_status()
+        document = response.text
+        # Fails on a page that is not the document, which must not be cached.
+        json.loads(document)
+        with open(path, "w") as f:
+            f.write(document)
+        return document
 
     def make_credentials(self):
+        from google.oauth2.credentials import Credentials
+
         with open(self.CONFIG["credentials_path"]) as f:
             data = json.load(f)
 
@@ -296,7 +800,3 @@ class App:
             client_secret=data["installed"]["client_secret"],
             token_uri=data["installed"]["token_uri"],
         )
-
-    @backoff.on_exception(backoff.expo, HttpError, max_tries=4)
-    def send_email_request(self, service, body):
-        service.users().messages().send(userId="me", body=body).execute()
@@ -0,0 +1,27 @@
+import json
+
+
+class Config:
+    # The file is read on first access rather than when app.app is imported,
+    # and a dict can be passed in instead of a path.
+    def __init__(self, path=None, data=None):
+        self.path = path
+        self.data = data
+
+    def load(self):
+        if self.data is None:
+            with open(self.path) as f:
+                self.data = json.load(f)
+        return self.data
+
+    def get(self, key, default=None):
+        return self.load().get(key, default)
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __setitem__(self, key, value):
+        self.load()[key] = value
+
+    def __contains__(self, key):
+        return key in self.load()
@@ -0,0 +1,76 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from app.http_cache import HttpCache
+from app.http_client import HttpClient
+from app.logger import Logger
+from app.metrics import metrics
+from app.rate_limiter import schedule
+
+
+class Crawler:
+    def __init__(self, client, max_concurrency=8, max_per_host=4, cache=None):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self.cache = cache
+        self.host_limits = {}
+        self.host_limits_lock = threading.Lock()
+        self.logger = Logger.get(__name__)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            HttpClient.from_config(config),
+            max_concurrency=config.get("max_concurrency", 8),
+            # Shared by the worker processes of a node like the rate limit.
+            max_per_host=max(
+                1,
+                config.get("max_per_host_concurrency", 4)
+                // config.get("local_workers", 1),
+            ),
+            cache=HttpCache.from_config(config),
+        )
+
+    def host_limit(self, url):
+        host = urlparse(url).netloc
+        with self.host_limits_lock:
+            if host not in self.host_limits:
+                self.host_limits[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self.host_limits[host]
+
+    def login(self, url, payload):
+        self.client.post(url, payload)
+
+    def fetch(self, url):
+        cached = self.cache.get(url) if self.cache is not None else None
+        headers = cached.validators() if cached is not None else {}
+
+        with self.host_limit(url):
+            html = self.client.get(url, headers=headers)
+
+        if cached is not None and html.status_code == 304:
+            self.cache.hit(cached)
+            metrics.inc("pages_not_modified")
+            return cached.body
+
+        metrics.inc("pages_fetched")
+        metrics.inc("bytes_fetched", len(html.content))
+        html.encoding = "utf-8"
+        if self.cache is not None:
+            self.cache.miss()
+            self.cache.store(url, html)
+        return html.text
+
+    def fetch_all(self, urls):
+        # Pages come back in the same order as urls, so callers can zip them
+        # with whatever produced the urls and keep the sequential semantics.
+        pages = [None] * len(urls)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = [
+                (i, executor.submit(self.fetch, urls[i])) for i in schedule(urls)
+            ]
+            for i, future in futures:
+                pages[i] = future.result()
+        return pages
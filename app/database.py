@@ -1,7 +1,8 @@
-from sqlalchemy import create_engine
+import datetime
+
+from sqlalchemy import and_, create_engine, event, or_
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy_utils import database_exists, create_database
 
 Base = declarative_base()
 
@@ -11,81 +12,172 @@ from app.models import DBLocation
 from app.models import DBArtist
 from app.models import DBVenue
 from app.models import DBPromoter
+from app.models import DBPage
+from app.models import DBOutboxMessage
+from app.models import DBCrawlJob
+from app.models import DBCrawlCheckpoint
+from app.models import DBCrawlShard
+from app.models import DBPendingEvent
 from app.logger import Logger
+from app.metrics import metrics
+from app.user import User
+
+
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    metrics.inc("db_queries")
 
 
 class Database:
+    BATCH_SIZE = 500
+
     def __init__(self, session):
         self.session = session
         self.logger = Logger.get(__name__)
 
     @classmethod
     def from_url(cls, database_url):
+        # app.migrations needs Base and the models from this module.
+        from app.migrations import Migrator
+
         engine = create_engine(database_url, echo=False)
+        event.listen(engine, "before_cursor_execute", count_query)
+        Migrator(engine).upgrade()
         Session = sessionmaker(bind=engine)
         session = Session()
         return cls(session)
 
     @classmethod
     def init_db(cls, database_url):
+        from sqlalchemy_utils import create_database
+
+        from app.migrations import Migrator
+
         create_database(database_url)
         engine = create_engine(database_url, echo=True)
         Base.metadata.create_all(engine)
+        Migrator(engine).stamp()
 
-    def update_user(self, user):
-        db_user = self.session.query(DBUser).filter_by(nickname=user.nickname).first()
-        if db_user is None:
-            self.logger.info(f"Adding new user {user.nickname} to the database")
-            db_user = DBUser(name=user.name, nickname=user.nickname, email=user.email)
-            self.session.add(db_user)
-            self.session.flush()
-        self.session.query(DBVenue).filter_by(user_id=db_user.id).delete()
-        self.session.query(DBArtist).filter_by(user_id=db_user.id).delete()
-        self.session.query(DBPromoter).filter_by(user_id=db_user.id).delete()
-
-        for location in user.locations:
-            if (
-                self.session.query(DBLocation)
-                .filter_by(name=location, user_id=db_user.id)
-                .first()
-                is None
-            ):
-                db_location = DBLocation(name=location, user_id=db_user.id)
-                self.session.add(db_location)
-        for artist in user.artists:
-            if (
-                self.session.query(DBArtist)
-                .filter_by(name=artist["name"], user_id=db_user.id)
-                .first()
-                is None
+    def update_users(self, users):
+        # All users are synced in one transaction: existing rows are loaded in
+        # one query per table and only the differences are written back.
+        db_users = {}
+        nicknames = [user.nickname for user in users]
+        for i in range(0, len(nicknames), self.BATCH_SIZE):
+            for db_user in self.session.query(DBUser).filter(
+                DBUser.nickname.in_(nicknames[i : i + self.BATCH_SIZE])
             ):
-                db_artist = DBArtist(
-                    name=artist["name"], tag=artist["tag"], user_id=db_user.id
+                db_users[db_user.nickname] = db_user
+
+        for user in users:
+            if user.nickname not in db_users:
+                self.logger.info(f"Adding new user {user.nickname} to the database")
+                db_user = DBUser(
+                    name=user.name, nickname=user.nickname, email=user.email
                 )
-                self.session.add(db_artist)
-        for venue in user.venues:
-            if (
-                self.session.query(DBVenue)
-                .filter_by(name=venue["name"], user_id=db_user.id)
-                .first()
-                is None
+                self.session.add(db_user)
+                db_users[user.nickname] = db_user
+            db_users[user.nickname].favourites_digest = user.favourites_digest
+        self.session.flush()
+
+        locations = {}
+        artists = {}
+        venues = {}
+        promoters = {}
+        for user in users:
+            user_id = db_users[user.nickname].id
+            # The first entry wins when a name is listed twice, as before.
+            locations[user_id] = dict.fromkeys(user.locations)
+            artists[user_id] = self.follows_by_name(user.artists)
+            venues[user_id] = self.follows_by_name(user.venues)
+            promoters[user_id] = self.follows_by_name(user.promoters)
+
+        self.sync_follows(DBLocation, locations)
+        self.sync_follows(DBArtist, artists)
+        self.sync_follows(DBVenue, venues)
+        self.sync_follows(DBPromoter, promoters)
+        self.session.commit()
+
+    def favourites_digests(self, nicknames):
+        digests = {}
+        for i in range(0, len(nicknames), self.BATCH_SIZE):
+            for row in self.session.query(
+                DBUser.nickname, DBUser.favourites_digest
+            ).filter(DBUser.nickname.in_(nicknames[i : i + self.BATCH_SIZE])):
+                digests[row.nickname] = row.favourites_digest
+        return digests
+
+    def load_follows(self, users):
+        # Fills users in with the follows stored by the last update_users,
+        # without downloading their favourites again.
+        by_id = {}
+        nicknames = [user.nickname for user in users]
+        users_by_nickname = {user.nickname: user for user in users}
+        for i in range(0, len(nicknames), self.BATCH_SIZE):
+            for row in self.session.query(DBUser.id, DBUser.nickname).filter(
+                DBUser.nickname.in_(nicknames[i : i + self.BATCH_SIZE])
             ):
-                db_venue = DBVenue(
-                    name=venue["name"], tag=venue["tag"], user_id=db_user.id
-                )
-                self.session.add(db_venue)
-        for promoter in user.promoters:
-            if (
-                self.session.query(DBPromoter)
-                .filter_by(name=promoter["name"], user_id=db_user.id)
-                .first()
-                is None
+                by_id[row.id] = users_by_nickname[row.nickname]
+
+        user_ids = list(by_id)
+        for model, add in (
+            (DBArtist, User.add_artist),
+            (DBVenue, User.add_venue),
+            (DBPromoter, User.add_promoter),
+        ):
+            for i in range(0, len(user_ids), self.BATCH_SIZE):
+                for row in (
+                    self.session.query(model.user_id, model.name, model.tag)
+                    .filter(model.user_id.in_(user_ids[i : i + self.BATCH_SIZE]))
+                    .order_by(model.id)
+                ):
+                    add(by_id[row.user_id], row.name, row.tag)
+        return users
+
+    def follows_by_name(self, items):
+        follows = {}
+        for item in items:
+            follows.setdefault(item["name"], item["tag"])
+        return follows
+
+    def sync_follows(self, model, wanted):
+        has_tag = hasattr(model, "tag")
+        columns = [model.id, model.user_id, model.name]
+        if has_tag:
+            columns.append(model.tag)
+
+        current = {}
+        user_ids = list(wanted)
+        for i in range(0, len(user_ids), self.BATCH_SIZE):
+            for row in self.session.query(*columns).filter(
+                model.user_id.in_(user_ids[i : i + self.BATCH_SIZE])
             ):
-                db_promoter = DBPromoter(
-                    name=promoter["name"], tag=promoter["tag"], user_id=db_user.id
-                )
-                self.session.add(db_promoter)
-        self.session.commit()
+                current.setdefault(row.user_id, {})[row.name] = row
+
+        removed = []
+        added = []
+        updated = []
+        for user_id, follows in wanted.items():
+            rows = current.get(user_id, {})
+            for name, row in rows.items():
+                if name not in follows:
+                    removed.append(row.id)
+                elif has_tag and row.tag != follows[name]:
+                    updated.append({"id": row.id, "tag": follows[name]})
+            for name, tag in follows.items():
+                if name not in rows:
+                    follow = {"name": name, "user_id": user_id}
+                    if has_tag:
+                        follow["tag"] = tag
+                    added.append(follow)
+
+        for i in range(0, len(removed), self.BATCH_SIZE):
+            self.session.query(model).filter(
+                model.id.in_(removed[i : i + self.BATCH_SIZE])
+            ).delete(synchronize_session=False)
+        if added:
+            self.session.bulk_insert_mappings(model, added)
+        if updated:
+            self.session.bulk_update_mappings(model, updated)
 
     def get_distinctive_items(self, item_name):
         self.logger.info(f"Getting {item_name} items from the database")
@@ -101,28 +193,404 @@ class Database:
             items.append({"name": item[0], "tag": item[1]})
         return items
 
-    def fetch_from_database(self, event_id, event_type):
+    def fetch_events(self, keys):
+        # Plain rows rather than ORM objects, so the result never comes from a
+        # stale identity map after the bulk writes below.
+        ids_by_type = {}
+        for event_id, event_type in keys:
+            ids_by_type.setdefault(event_type, set()).add(event_id)
+
+        events = {}
+        for event_type, event_ids in ids_by_type.items():
+            event_ids = sorted(event_ids)
+            for i in range(0, len(event_ids), self.BATCH_SIZE):
+                rows = self.session.query(
+                    DBEvent.id,
+                    DBEvent.event_id,
+                    DBEvent.event_type,
+                    DBEvent.tickets_available,
+                ).filter(
+                    DBEvent.event_type == event_type,
+                    DBEvent.event_id.in_(event_ids[i : i + self.BATCH_SIZE]),
+                )
+                for row in rows:
+                    events[(row.event_id, row.event_type)] = row
+        return events
+
+    def add_events(self, events):
+        if events:
+            self.session.bulk_insert_mappings(DBEvent, events)
+
+    def update_events(self, events):
+        if events:
+            self.session.bulk_update_mappings(DBEvent, events)
+
+    def touch_events(self, event_type, event_ids, seen_at):
+        for i in range(0, len(event_ids), self.BATCH_SIZE):
+            self.session.query(DBEvent).filter(
+                DBEvent.event_type == event_type,
+                DBEvent.event_id.in_(event_ids[i : i + self.BATCH_SIZE]),
+            ).update({DBEvent.last_seen: seen_at}, synchronize_session=False)
+
+    def prune_events(self, before_date, unseen_since):
+        # Events are removed once their date has passed, and events without a
+        # parsed date once no listing has shown them for a while. Each batch
+        # is committed on its own to keep transactions short.
+        #
+        # A past event still shown by a listing, such as a festival on its
+        # last day, is kept: stored again, it would be notified as new.
+        cutoff = datetime.datetime.combine(before_date, datetime.time())
+        condition = or_(
+            and_(DBEvent.event_date < before_date, DBEvent.last_seen < cutoff),
+            and_(DBEvent.event_date.is_(None), DBEvent.last_seen < unseen_since),
+        )
+        pruned = 0
+        while True:
+            ids = [
+                row.id
+                for row in self.session.query(DBEvent.id)
+                .filter(condition)
+                .limit(self.BATCH_SIZE)
+            ]
+            if not ids:
+                break
+            self.session.query(DBEvent).filter(DBEvent.id.in_(ids)).delete(
+                synchronize_session=False
+            )
+            self.session.commit()
+            pruned += len(ids)
+        self.logger.info(f"Pruned {pruned} events from the database")
+        return pruned
+
+    def vacuum(self):
+        engine = self.session.get_bind()
+        if engine.dialect.name != "sqlite":
+            self.logger.warning("VACUUM is only run on SQLite databases")
+            return
+        self.session.close()
+        with engine.connect() as connection:
+            connection.execute("VACUUM")
+
+    def has_unwatched_events(self, event_type, event_ids):
+        # Events waiting for tickets without a payload, stored before the
+        # ticket watcher existed, which it cannot check on its own.
+        if not event_ids:
+            return False
+        return (
+            self.session.query(DBEvent.id)
+            .filter(
+                DBEvent.event_type == event_type,
+                DBEvent.event_id.in_(event_ids),
+                DBEvent.tickets_available.isnot(True),
+                DBEvent.payload.is_(None),
+            )
+            .first()
+            is not None
+        )
+
+    def waiting_event_payloads(self, event_type, event_ids):
+        payloads = []
+        for i in range(0, len(event_ids), self.BATCH_SIZE):
+            payloads.extend(
+                row.payload
+                for row in self.session.query(DBEvent.payload).filter(
+                    DBEvent.event_type == event_type,
+                    DBEvent.event_id.in_(event_ids[i : i + self.BATCH_SIZE]),
+                    DBEvent.tickets_available.isnot(True),
+                    DBEvent.payload.isnot(None),
+                )
+            )
+        return payloads
+
+    def pending_ticket_events(self, first_date, last_date, checked_before, limit):
+        # Events waiting for tickets dated first_date to last_date, or undated
+        # when both are None, that were not checked since checked_before. The
+        # longest unchecked come first, never checked ones last. Payloads are
+        # left out, they are only loaded for the events that get checked.
+        #
+        # Events from before the watcher existed have no payload to notify
+        # with, the next crawl that lists them fills it in.
+        query = self.session.query(
+            DBEvent.id, DBEvent.event_date, DBEvent.last_checked
+        ).filter(
+            DBEvent.tickets_available.isnot(True),
+            DBEvent.payload.isnot(None),
+            or_(
+                DBEvent.last_checked.is_(None),
+                DBEvent.last_checked <= checked_before,
+            ),
+        )
+        if first_date is None and last_date is None:
+            query = query.filter(DBEvent.event_date.is_(None))
+        else:
+            query = query.filter(DBEvent.event_date >= first_date)
+            if last_date is not None:
+                query = query.filter(DBEvent.event_date <= last_date)
+        return (
+            query.order_by(DBEvent.last_checked.is_(None), DBEvent.last_checked)
+            .limit(limit)
+            .all()
+        )
+
+    def event_payloads(self, ids):
+        payloads = {}
+        for i in range(0, len(ids), self.BATCH_SIZE):
+            for row in self.session.query(DBEvent.id, DBEvent.payload).filter(
+                DBEvent.id.in_(ids[i : i + self.BATCH_SIZE])
+            ):
+                payloads[row.id] = row.payload
+        return payloads
+
+    def fetch_page(self, entity_type, tag):
+        return (
+            self.session.query(DBPage)
+            .filter_by(entity_type=entity_type, tag=tag)
+            .first()
+        )
+
+    def update_page(self, entity_type, tag, digest, event_ids):
+        page = self.fetch_page(entity_type, tag)
+        if page is None:
+            page = DBPage(entity_type=entity_type, tag=tag)
+            self.session.add(page)
+        page.digest = digest
+        page.event_ids = ",".join(event_ids)
+
+    def enqueue_message(self, idempotency_key, recipient, subject, body, now):
+        exists = (
+            self.session.query(DBOutboxMessage.id)
+            .filter_by(idempotency_key=idempotency_key)
+            .first()
+        )
+        if exists is not None:
+            return False
+        self.session.add(
+            DBOutboxMessage(
+                idempotency_key=idempotency_key,
+                recipient=recipient,
+                subject=subject,
+                body=body,
+                status="pending",
+                attempts=0,
+                next_attempt_at=now,
+                created_at=now,
+            )
+        )
+        return True
+
+    def claim_messages(self, token, now, lease_until, limit):
+        # Messages still "sending" after their lease belong to a worker that
+        # died mid-send and are due again.
+        due = (
+            self.session.query(DBOutboxMessage.id)
+            .filter(
+                DBOutboxMessage.status.in_(("pending", "sending")),
+                DBOutboxMessage.next_attempt_at <= now,
+            )
+            .order_by(DBOutboxMessage.id)
+            .limit(limit)
+        )
+        ids = [row.id for row in due]
+        if not ids:
+            return []
+        # Only rows that are still due get claimed, so two workers never
+        # send the same message.
+        self.session.query(DBOutboxMessage).filter(
+            DBOutboxMessage.id.in_(ids),
+            DBOutboxMessage.status.in_(("pending", "sending")),
+            DBOutboxMessage.next_attempt_at <= now,
+        ).update(
+            {
+                DBOutboxMessage.status: "sending",
+                DBOutboxMessage.claimed_by: token,
+                DBOutboxMessage.next_attempt_at: lease_until,
+            },
+            synchronize_session=False,
+        )
+        self.session.commit()
         return (
-            self.session.query(DBEvent)
-            .filter_by(event_id=event_id, event_type=event_type)
+            self.session.query(DBOutboxMessage)
+            .filter_by(claimed_by=token, status="sending")
+            .order_by(DBOutboxMessage.id)
+            .all()
+        )
+
+    def count_failed_messages(self):
+        return self.session.query(DBOutboxMessage).filter_by(status="failed").count()
+
+    def start_crawl_job(self, now, max_age):
+        job = (
+            self.session.query(DBCrawlJob)
+            .filter_by(status="running")
+            .order_by(DBCrawlJob.id.desc())
             .first()
         )
+        if job is not None and job.started_at >= now - max_age:
+            self.logger.info(f"Resuming crawl job {job.id} from {job.started_at}")
+            return job
+
+        new_job = DBCrawlJob(status="running", started_at=now)
+        self.session.add(new_job)
+        self.session.flush()
+
+        if job is not None:
+            # Too old to resume, but its detected events were never notified.
+            self.logger.info(f"Abandoning crawl job {job.id} from {job.started_at}")
+            self.session.query(DBPendingEvent).filter_by(job_id=job.id).update(
+                {DBPendingEvent.job_id: new_job.id}, synchronize_session=False
+            )
+            self.session.query(DBCrawlCheckpoint).filter_by(job_id=job.id).delete(
+                synchronize_session=False
+            )
+            self.session.query(DBCrawlShard).filter_by(job_id=job.id).delete(
+                synchronize_session=False
+            )
+            job.status = "abandoned"
+            job.finished_at = now
+
+        self.session.commit()
+        return new_job
 
-    def add_event(self, event_id, event_type, tickets_available):
-        event = DBEvent(
-            event_id=event_id,
-            event_type=event_type,
-            tickets_available=tickets_available,
+    def completed_entities(self, job_id):
+        return {
+            (row.entity_type, row.tag)
+            for row in self.session.query(
+                DBCrawlCheckpoint.entity_type, DBCrawlCheckpoint.tag
+            ).filter_by(job_id=job_id)
+        }
+
+    def checkpoint_entity(self, job_id, entity_type, tag):
+        self.session.add(
+            DBCrawlCheckpoint(job_id=job_id, entity_type=entity_type, tag=tag)
         )
-        self.session.add(event)
 
-    def update_event(self, event_id, event_type, tickets_available):
-        event = (
-            self.session.query(DBEvent)
-            .filter_by(event_id=event_id, event_type=event_type)
+    def add_pending_events(self, job_id, payloads):
+        if payloads:
+            self.session.bulk_insert_mappings(
+                DBPendingEvent,
+                [{"job_id": job_id, "payload": payload} for payload in payloads],
+            )
+
+    def pending_events(self, job_id):
+        return [
+            row.payload
+            for row in self.session.query(DBPendingEvent.payload)
+            .filter_by(job_id=job_id)
+            .order_by(DBPendingEvent.id)
+        ]
+
+    def running_crawl_job(self):
+        return (
+            self.session.query(DBCrawlJob)
+            .filter_by(status="running")
+            .order_by(DBCrawlJob.id.desc())
             .first()
         )
-        event.tickets_available = tickets_available
+
+    def create_shards(self, job_id, shards):
+        # A resumed job keeps the shards it was started with, its finished
+        # shards are not crawled again.
+        existing = self.session.query(DBCrawlShard.shards).filter_by(job_id=job_id)
+        row = existing.first()
+        if row is not None:
+            return row.shards
+        self.session.bulk_insert_mappings(
+            DBCrawlShard,
+            [
+                {
+                    "job_id": job_id,
+                    "shard": shard,
+                    "shards": shards,
+                    "status": "pending",
+                }
+                for shard in range(shards)
+            ],
+        )
+        self.session.commit()
+        return shards
+
+    def claim_shard(self, job_id, token, now, lease_until):
+        # Shards still "running" after their lease belong to a worker that
+        # died and are claimed again, like outbox messages.
+        due = and_(
+            DBCrawlShard.job_id == job_id,
+            or_(
+                DBCrawlShard.status == "pending",
+                and_(DBCrawlShard.status == "running", DBCrawlShard.lease_until < now),
+            ),
+        )
+        row = (
+            self.session.query(DBCrawlShard.id)
+            .filter(due)
+            .order_by(DBCrawlShard.shard)
+            .first()
+        )
+        if row is None:
+            return None
+        claimed = (
+            self.session.query(DBCrawlShard)
+            .filter(DBCrawlShard.id == row.id, due)
+            .update(
+                {
+                    DBCrawlShard.status: "running",
+                    DBCrawlShard.claimed_by: token,
+                    DBCrawlShard.lease_until: lease_until,
+                },
+                synchronize_session=False,
+            )
+        )
+        self.session.commit()
+        if not claimed:
+            # Another worker was faster, try the next shard.
+            return self.claim_shard(job_id, token, now, lease_until)
+        return (
+            self.session.query(DBCrawlShard.id, DBCrawlShard.shard, DBCrawlShard.shards)
+            .filter_by(id=row.id)
+            .one()
+        )
+
+    def finish_shard(self, shard_id):
+        self.session.query(DBCrawlShard).filter_by(id=shard_id).update(
+            {DBCrawlShard.status: "finished"}, synchronize_session=False
+        )
+
+    def release_shard(self, shard_id):
+        self.session.query(DBCrawlShard).filter_by(id=shard_id).update(
+            {
+                DBCrawlShard.status: "pending",
+                DBCrawlShard.claimed_by: None,
+                DBCrawlShard.lease_until: None,
+            },
+            synchronize_session=False,
+        )
+
+    def count_unfinished_shards(self, job_id):
+        return (
+            self.session.query(DBCrawlShard)
+            .filter(DBCrawlShard.job_id == job_id, DBCrawlShard.status != "finished")
+            .count()
+        )
+
+    def finish_crawl_job(self, job, now):
+        self.session.query(DBPendingEvent).filter_by(job_id=job.id).delete(
+            synchronize_session=False
+        )
+        self.session.query(DBCrawlCheckpoint).filter_by(job_id=job.id).delete(
+            synchronize_session=False
+        )
+        self.session.query(DBCrawlShard).filter_by(job_id=job.id).delete(
+            synchronize_session=False
+        )
+        job.status = "finished"
+        job.finished_at = now
+        # Only the last finished job is kept, a daemon finishes one per tick.
+        self.session.query(DBCrawlJob).filter(
+            DBCrawlJob.id != job.id,
+            DBCrawlJob.status.in_(("finished", "abandoned")),
+        ).delete(synchronize_session=False)
 
     def commit(self):
         self.session.commit()
+
+    def rollback(self):
+        self.session.rollback()
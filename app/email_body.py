@@ -1,35 +1,54 @@
 class EmailBody:
     def __init__(self, name):
-        self.message = f"Hi <b>{name},</b> <br><br><br>"
+        # Parts are joined once in get(), appending to a string would copy
+        # the whole message for every event added.
+        self.parts = [f"Hi <b>{name},</b> <br><br><br>"]
 
-    def add_venue_event(self, event):
-        self.message += f"<p> New event at <b>{event.venue}</b> \
+    @staticmethod
+    def render_venue_event(event):
+        return f"<p> New event at <b>{event.venue}</b> \
         named <i>{event.name}</i> \
         with a lineup of <b>{event.lineup}</b> \
         on {event.date} has been added here: {event.event_url}<br>"
 
-    def add_artist_event(self, event):
-        self.message += f"<p>New event: <b>{event.artist}</b> \
+    @staticmethod
+    def render_artist_event(event):
+        return f"<p>New event: <b>{event.artist}</b> \
         is playing at <b>{event.venue}</b> on {event.date} \
         at the night called <i>{event.name}</i>. \
         Find it here: {event.event_url}<br>"
 
-    def add_promoter_event(self, event):
-        self.message += f"<p> New promoter <b>{event.promoter}</b> event at \
+    @staticmethod
+    def render_promoter_event(event):
+        return f"<p> New promoter <b>{event.promoter}</b> event at \
         <b>{event.venue}</b> named <i>{event.name}</i> \
         with a lineup of <b>{event.lineup}</b> \
         on {event.date} has been added here: {event.event_url}<br>"
 
-    def add_tickets(self, tickets):
-        tickets_message = ""
+    @staticmethod
+    def render_tickets(tickets):
+        parts = []
         if tickets:
-            tickets_message += "<b>Tickets currently on sale:</b><br>"
+            parts.append("<b>Tickets currently on sale:</b><br>")
             for ticket in tickets:
                 name = ticket["name"]
                 price = ticket["price"]
-                tickets_message += f"    <u>{name}</u>: {price}<br>"
-        tickets_message += "<br>"
-        self.message += tickets_message
+                parts.append(f"    <u>{name}</u>: {price}<br>")
+        parts.append("<br>")
+        return "".join(parts)
+
+    @classmethod
+    def render_event(cls, event):
+        if event.event_type == "venue":
+            html = cls.render_venue_event(event)
+        elif event.event_type == "artist":
+            html = cls.render_artist_event(event)
+        elif event.event_type == "promoter":
+            html = cls.render_promoter_event(event)
+        return html + cls.render_tickets(event.tickets)
+
+    def add_fragment(self, fragment):
+        self.parts.append(fragment)
 
     def add_ending(self, venues_list, artists_list, promoters_list, locations_list):
         emoji = "\u2764"
@@ -39,7 +58,20 @@ class EmailBody:
                 Your new artist events locations: <br> \
                 <b>{locations_list}</b> <br><br> \
                 Thanks for supporting this tech. {emoji}"
-        self.message += ending
+        self.parts.append(ending)
 
     def get(self):
-        return self.message
+        return "".join(self.parts)
+
+
+class FragmentCache:
+    # Every recipient of an event gets the same HTML, so it is rendered once
+    # per run and the email bodies only hold references to it.
+    def __init__(self):
+        self.fragments = {}
+
+    def get(self, event):
+        key = (event.event_id, event.event_type)
+        if key not in self.fragments:
+            self.fragments[key] = EmailBody.render_event(event)
+        return self.fragments[key]
@@ -1,8 +1,25 @@
-import requests
-from bs4 import BeautifulSoup
+import datetime
+import re
+import sys
+
+DATE_PATTERN = re.compile(r"(\d{1,2})\s+([A-Za-z]{3})[A-Za-z]*\s+(\d{4})")
 
 
 class Event:
+    FIELDS = (
+        "name",
+        "venue",
+        "lineup",
+        "date",
+        "promoter",
+        "artist",
+        "event_id",
+        "event_url",
+        "event_type",
+    )
+    # A full crawl holds thousands of events, slots keep them small.
+    __slots__ = FIELDS + ("tickets",)
+
     def __init__(
         self,
         name,
@@ -16,14 +33,40 @@ class Event:
         event_type,
     ):
         self.name = name
-        self.venue = venue
+        # The same few venues and types repeat across every event.
+        self.venue = sys.intern(venue)
         self.lineup = lineup
         self.date = date
         self.promoter = promoter
         self.artist = artist
         self.event_id = event_id
         self.event_url = event_url
-        self.event_type = event_type
+        self.event_type = sys.intern(event_type)
+        self.tickets = []
+
+    def to_dict(self):
+        data = {field: getattr(self, field) for field in self.FIELDS}
+        data["tickets"] = self.tickets
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        event = cls(*(data[field] for field in cls.FIELDS))
+        event.tickets = data.get("tickets", [])
+        return event
+
+    def parsed_date(self):
+        # Listing dates look like "Sat, 18 May 2019", possibly followed by
+        # the venue on artist and promoter pages.
+        match = DATE_PATTERN.search(self.date)
+        if match is None:
+            return None
+        try:
+            return datetime.datetime.strptime(
+                " ".join(match.groups()), "%d %b %Y"
+            ).date()
+        except ValueError:
+            return None
 
     @classmethod
     def from_venue_html(cls, venue, event_html):
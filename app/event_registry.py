@@ -0,0 +1,23 @@
+class EventRegistry:
+    # The same event shows up on its venue's, artists' and promoters' pages,
+    # but its ticket page only needs to be fetched once per run.
+    def __init__(self):
+        self.tickets = {}
+        self.fetches = 0
+        self.fetches_avoided = 0
+
+    def __contains__(self, event_id):
+        return event_id in self.tickets
+
+    def add(self, event_id, tickets):
+        self.tickets[event_id] = tickets
+        self.fetches += 1
+
+    def get(self, event_id):
+        return self.tickets[event_id]
+
+    def avoided(self):
+        self.fetches_avoided += 1
+
+    def stats(self):
+        return {"fetches": self.fetches, "fetches_avoided": self.fetches_avoided}
@@ -0,0 +1,109 @@
+import sqlite3
+import threading
+import time
+
+from app.logger import Logger
+
+
+class CachedResponse:
+    def __init__(self, url, etag, last_modified, body):
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body = body
+
+    def validators(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    def __init__(self, path, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, "
+            "body TEXT, size INTEGER, accessed REAL)"
+        )
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.logger = Logger.get(__name__)
+
+    @classmethod
+    def from_config(cls, config):
+        path = config.get("http_cache_path")
+        if not path:
+            return None
+        return cls(path, config.get("http_cache_max_bytes", 100 * 1024 * 1024))
+
+    def get(self, url):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT etag, last_modified, body FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.connection.execute(
+                "UPDATE responses SET accessed = ? WHERE url = ?", (time.time(), url)
+            )
+            self.connection.commit()
+        return CachedResponse(url, *row)
+
+    def hit(self, cached):
+        with self.lock:
+            self.hits += 1
+            self.bytes_saved += len(cached.body.encode("utf-8"))
+
+    def miss(self):
+        with self.lock:
+            self.misses += 1
+
+    def store(self, url, response):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if response.status_code != 200 or not (etag or last_modified):
+            return
+
+        body = response.text
+        size = len(body.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, body, size, time.time()),
+            )
+            self.evict()
+            self.connection.commit()
+
+    def evict(self):
+        # Least recently used entries go first until the store fits again.
+        total = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for url, size in self.connection.execute(
+            "SELECT url, size FROM responses ORDER BY accessed"
+        ).fetchall():
+            self.connection.execute("DELETE FROM responses WHERE url = ?", (url,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes_saved": self.bytes_saved,
+        }
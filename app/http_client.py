@@ -0,0 +1,159 @@
+import datetime
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.logger import Logger
+from app.metrics import metrics
+from app.rate_limiter import RateLimiter
+from app.replay import RecordingAdapter, ReplayAdapter
+
+
+class HttpClient:
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        pool_size=8,
+        connect_timeout=5,
+        read_timeout=30,
+        max_tries=4,
+        backoff_base=1,
+        backoff_max=60,
+        rate_limiter=None,
+        adapter=None,
+    ):
+        self.rate_limiter = rate_limiter
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_tries = max_tries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        # Keep one connection per worker alive so pages reuse the TCP and TLS
+        # handshake instead of paying for it on every request.
+        self.session = requests.Session()
+        if adapter is None:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.latencies = metrics.histogram("http_request_seconds")
+        self.retries = 0
+        self.lock = threading.Lock()
+        self.logger = Logger.get(__name__)
+
+    @classmethod
+    def from_config(cls, config):
+        pool_size = config.get("max_concurrency", 8)
+        # Recorded traffic stands in for the network when replaying. It costs
+        # the site nothing, so it is not rate limited either.
+        adapter = None
+        rate_limiter = RateLimiter.from_config(config)
+        if config.get("replay_dir"):
+            adapter = ReplayAdapter.from_config(config)
+            rate_limiter = None
+        elif config.get("record_dir"):
+            adapter = RecordingAdapter(
+                config["record_dir"],
+                pool_connections=pool_size,
+                pool_maxsize=pool_size,
+            )
+
+        return cls(
+            pool_size=pool_size,
+            connect_timeout=config.get("http_connect_timeout", 5),
+            read_timeout=config.get("http_read_timeout", 30),
+            max_tries=config.get("http_max_tries", 4),
+            backoff_base=config.get("http_backoff_base", 1),
+            backoff_max=config.get("http_backoff_max", 60),
+            rate_limiter=rate_limiter,
+            adapter=adapter,
+        )
+
+    def post(self, url, data):
+        return self.request("POST", url, data=data)
+
+    def get(self, url, headers=None):
+        return self.request("GET", url, headers=headers)
+
+    def request(self, method, url, **kwargs):
+        for attempt in range(1, self.max_tries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(url)
+            start = time.monotonic()
+            try:
+                response = self.session.request(
+                    method, url, timeout=self.timeout, **kwargs
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.feedback(url, None, time.monotonic() - start)
+                if attempt == self.max_tries:
+                    raise
+                delay = self.backoff_delay(attempt)
+                reason = type(e).__name__
+            else:
+                latency = time.monotonic() - start
+                self.record(latency)
+                if self.rate_limiter is not None:
+                    self.rate_limiter.feedback(url, response.status_code, latency)
+                if (
+                    response.status_code not in self.RETRY_STATUSES
+                    or attempt == self.max_tries
+                ):
+                    return response
+                delay = self.retry_after(response)
+                if delay is None:
+                    delay = self.backoff_delay(attempt)
+                reason = response.status_code
+
+            with self.lock:
+                self.retries += 1
+            self.logger.warning(
+                f"{method} {url} failed with {reason}, retrying in {delay:.1f}s"
+            )
+            time.sleep(delay)
+
+    def backoff_delay(self, attempt):
+        # Full jitter keeps concurrent workers from retrying in lockstep.
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        )
+
+    def retry_after(self, response):
+        value = response.headers.get("Retry-After")
+        if value is None:
+            return None
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+            if retry_at.tzinfo is None:
+                retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+            delay = (
+                retry_at - datetime.datetime.now(datetime.timezone.utc)
+            ).total_seconds()
+        return min(max(delay, 0), self.backoff_max)
+
+    def record(self, latency):
+        metrics.observe("http_request_seconds", latency)
+
+    def stats(self):
+        with self.lock:
+            retries = self.retries
+        stats = {"requests": self.latencies.count, "retries": retries}
+        if self.latencies.count:
+            stats["mean"] = self.latencies.sum / self.latencies.count
+            stats["p50"] = self.latencies.quantile(0.5)
+            stats["p95"] = self.latencies.quantile(0.95)
+            stats["max"] = self.latencies.max
+        if self.rate_limiter is not None:
+            stats["rates"] = self.rate_limiter.rates()
+        return stats
@@ -7,11 +7,14 @@ class Logger:
         logger = logging.getLogger(name)
         logger.setLevel(logging.DEBUG)
 
-        handler = logging.StreamHandler()
-        formatter = logging.Formatter(
-            "%(asctime)s : %(levelname)s : %(name)s : %(message)s"
-        )
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
+        # Every instance asks for its module's logger again, it must only get
+        # one handler or each line is printed once per instance.
+        if not logger.handlers:
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter(
+                "%(asctime)s : %(levelname)s : %(name)s : %(message)s"
+            )
+            handler.setFormatter(formatter)
+            logger.addHandler(handler)
 
         return logger
@@ -0,0 +1,196 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+from app.logger import Logger
+
+
+class Histogram:
+    # Fixed buckets, so a long running daemon keeps constant memory however
+    # many observations it records.
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the quantile, the largest value
+        # seen for the overflow bucket.
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(value)
+
+    def histogram(self, name):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            return self.histograms[name]
+
+    @contextmanager
+    def timer(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start)
+
+    def stage(self, name):
+        return self.timer(f"stage_{name}_seconds")
+
+    def to_json(self):
+        with self.lock:
+            data = {
+                "counters": dict(self.counters),
+                "histograms": {
+                    name: histogram.to_dict()
+                    for name, histogram in self.histograms.items()
+                },
+            }
+        return json.dumps(data, indent=2, sort_keys=True)
+
+    def to_prometheus(self, prefix="ra_notify_"):
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}{name}_total counter")
+                lines.append(f"{prefix}{name}_total {value}")
+            for name, histogram in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}{name}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}{name}_bucket{{le="+Inf"}} {histogram.count}')
+                lines.append(f"{prefix}{name}_sum {histogram.sum}")
+                lines.append(f"{prefix}{name}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        # The format follows the file name, Prometheus text unless it ends in
+        # .json. The file is replaced atomically for scrapers reading it.
+        body = self.to_json() if path.endswith(".json") else self.to_prometheus()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+
+
+class Profiler:
+    # Optional profiling of hot functions, enabled per function name from
+    # the config. Each function's profile accumulates over the run and is
+    # dumped next to the metrics.
+    def __init__(self, functions=(), output_dir=".", backend="cprofile"):
+        self.functions = set(functions)
+        self.output_dir = output_dir
+        self.backend = backend
+        self.profiles = {}
+        self.logger = Logger.get(__name__)
+
+        if self.functions and backend == "pyinstrument":
+            try:
+                import pyinstrument  # noqa: F401
+            except ImportError:
+                self.logger.warning("pyinstrument is not installed, using cProfile")
+                self.backend = "cprofile"
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            functions=config.get("profile_functions", []),
+            output_dir=config.get("profile_dir", "."),
+            backend=config.get("profiler", "cprofile"),
+        )
+
+    @contextmanager
+    def profile(self, name):
+        if name not in self.functions:
+            yield
+            return
+
+        if name not in self.profiles:
+            self.profiles[name] = self.make_profile()
+        profile = self.profiles[name]
+        if self.backend == "pyinstrument":
+            # Samples of every start/stop session are combined.
+            profile.start()
+            try:
+                yield
+            finally:
+                profile.stop()
+        else:
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+
+    def make_profile(self):
+        if self.backend == "pyinstrument":
+            from pyinstrument import Profiler as Instrument
+
+            return Instrument()
+        import cProfile
+
+        return cProfile.Profile()
+
+    def dump(self, suffix=None):
+        for name, profile in self.profiles.items():
+            if suffix is not None:
+                name = f"{name}.{suffix}"
+            if self.backend == "pyinstrument":
+                path = os.path.join(self.output_dir, f"{name}.html")
+                with open(path, "w") as f:
+                    f.write(profile.output_html())
+            else:
+                path = os.path.join(self.output_dir, f"{name}.prof")
+                profile.dump_stats(path)
+            self.logger.info(f"Wrote {name} profile to {path}")
+
+
+# One registry per process, shared by every module like the loggers.
+metrics = Metrics()
@@ -0,0 +1,144 @@
+import datetime
+
+from sqlalchemy import case, inspect, select
+
+from app.database import Base
+from app.logger import Logger
+from app.models import DBEvent, DBSchemaVersion, DBUser
+
+# Which of several duplicate rows is kept, the oldest one unless listed
+# here. An event that already has tickets must not be notified again.
+KEEP_FIRST = {
+    "venueevents": (case([(DBEvent.__table__.c.tickets_available, 0)], else_=1),),
+}
+
+
+def create_missing_indexes(connection):
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for index in table.indexes:
+            # Indexes on columns a later migration adds are created by it.
+            if (
+                index.name in existing
+                or not {column.name for column in index.columns} <= columns
+            ):
+                continue
+            if index.unique:
+                remove_duplicates(connection, table, index)
+            index.create(connection)
+
+
+def remove_duplicates(connection, table, index):
+    # Older databases have no constraints, keep one row of each key so the
+    # unique index can be built. Rows of other tables pointing at a removed
+    # row go with it, follows are synced again from the profile anyway.
+    key_columns = list(index.columns)
+    rows = connection.execute(
+        select([table.c.id] + key_columns).order_by(
+            *KEEP_FIRST.get(table.name, ()), table.c.id
+        )
+    )
+    kept = set()
+    removed = []
+    for row in rows:
+        key = tuple(row[column] for column in key_columns)
+        if key in kept:
+            removed.append(row.id)
+        else:
+            kept.add(key)
+
+    children = [
+        (child, foreign_key.parent)
+        for child in Base.metadata.sorted_tables
+        for foreign_key in child.foreign_keys
+        if foreign_key.column is table.c.id
+    ]
+    for start in range(0, len(removed), 500):
+        ids = removed[start : start + 500]
+        for child, column in children:
+            connection.execute(child.delete().where(column.in_(ids)))
+        connection.execute(table.delete().where(table.c.id.in_(ids)))
+
+
+def add_column(connection, table, column):
+    existing = {c["name"] for c in inspect(connection).get_columns(table.name)}
+    if column.name in existing:
+        return
+    column_type = column.type.compile(dialect=connection.dialect)
+    connection.execute(
+        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+    )
+
+
+def add_event_retention(connection):
+    table = DBEvent.__table__
+    add_column(connection, table, table.c.event_date)
+    add_column(connection, table, table.c.last_seen)
+    # Existing rows start their retention clock now rather than being pruned
+    # on the first run.
+    connection.execute(
+        table.update().where(table.c.last_seen.is_(None)),
+        last_seen=datetime.datetime.utcnow(),
+    )
+    create_missing_indexes(connection)
+
+
+def add_ticket_watch(connection):
+    table = DBEvent.__table__
+    add_column(connection, table, table.c.last_checked)
+    add_column(connection, table, table.c.payload)
+    create_missing_indexes(connection)
+
+
+def add_favourites_digest(connection):
+    table = DBUser.__table__
+    add_column(connection, table, table.c.favourites_digest)
+
+
+# Each migration brings the schema from version - 1 to version. Tables that
+# did not exist before are created by create_all, migrations only have to
+# alter the ones that did.
+MIGRATIONS = [
+    (1, create_missing_indexes),
+    (2, add_event_retention),
+    (3, add_ticket_watch),
+    (4, add_favourites_digest),
+]
+
+
+class Migrator:
+    def __init__(self, engine):
+        self.engine = engine
+        self.logger = Logger.get(__name__)
+
+    @classmethod
+    def latest_version(cls):
+        return MIGRATIONS[-1][0]
+
+    def current_version(self, connection):
+        row = connection.execute(
+            DBSchemaVersion.__table__.select().order_by(DBSchemaVersion.id.desc())
+        ).first()
+        return row.version if row is not None else 0
+
+    def set_version(self, connection, version):
+        connection.execute(DBSchemaVersion.__table__.delete())
+        connection.execute(DBSchemaVersion.__table__.insert(), version=version)
+
+    def stamp(self):
+        with self.engine.begin() as connection:
+            self.set_version(connection, self.latest_version())
+
+    def upgrade(self):
+        Base.metadata.create_all(self.engine)
+
+        with self.engine.begin() as connection:
+            version = self.current_version(connection)
+            for target, migration in MIGRATIONS:
+                if target <= version:
+                    continue
+                self.logger.info(f"Migrating database to version {target}")
+                migration(connection)
+                self.set_version(connection, target)
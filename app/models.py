@@ -1,15 +1,27 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Date,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+)
 from sqlalchemy.orm import relationship
 from app.database import Base
 
 
 class DBUser(Base):
     __tablename__ = "users"
+    __table_args__ = (Index("ix_users_nickname", "nickname", unique=True),)
 
     id = Column(Integer, primary_key=True)
     name = Column(String(50))
     nickname = Column(String(50))
     email = Column(String(50))
+    favourites_digest = Column(String(64))
     locations = relationship("DBLocation", backref="user")
     artists = relationship("DBArtist", backref="user")
     venues = relationship("DBVenue", backref="user")
@@ -21,6 +33,9 @@ class DBUser(Base):
 
 class DBLocation(Base):
     __tablename__ = "locations"
+    __table_args__ = (
+        Index("ix_locations_user_id_name", "user_id", "name", unique=True),
+    )
     id = Column(Integer, primary_key=True)
     name = Column(String(50))
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -31,6 +46,7 @@ class DBLocation(Base):
 
 class DBArtist(Base):
     __tablename__ = "artists"
+    __table_args__ = (Index("ix_artists_user_id_name", "user_id", "name", unique=True),)
     id = Column(Integer, primary_key=True)
     name = Column(String(50))
     tag = Column(String(50))
@@ -42,6 +58,7 @@ class DBArtist(Base):
 
 class DBVenue(Base):
     __tablename__ = "venues"
+    __table_args__ = (Index("ix_venues_user_id_name", "user_id", "name", unique=True),)
     id = Column(Integer, primary_key=True)
     name = Column(String(50))
     tag = Column(String(50))
@@ -53,6 +70,9 @@ class DBVenue(Base):
 
 class DBPromoter(Base):
     __tablename__ = "promoters"
+    __table_args__ = (
+        Index("ix_promoters_user_id_name", "user_id", "name", unique=True),
+    )
     id = Column(Integer, primary_key=True)
     name = Column(String(50))
     tag = Column(String(50))
@@ -64,13 +84,139 @@ class DBPromoter(Base):
 
 class DBEvent(Base):
     __tablename__ = "venueevents"
+    __table_args__ = (
+        Index(
+            "ix_venueevents_event_type_event_id", "event_type", "event_id", unique=True
+        ),
+        Index("ix_venueevents_event_date", "event_date"),
+        Index("ix_venueevents_tickets_available", "tickets_available"),
+    )
 
     id = Column(Integer, primary_key=True)
     event_id = Column(String(50))
     event_type = Column(String(10))
     tickets_available = Column(Boolean)
+    event_date = Column(Date)
+    last_seen = Column(DateTime)
+    last_checked = Column(DateTime)
+    payload = Column(Text)
 
     def __repr__(self):
         return f"<DBEvent(event_id={self.event_id}, \
                 event_type={self.event_type}, \
-                tickets_available={self.tickets_available})>"
+                tickets_available={self.tickets_available}, \
+                event_date={self.event_date})>"
+
+
+class DBPage(Base):
+    __tablename__ = "pagedigests"
+    __table_args__ = (
+        Index("ix_pagedigests_entity_type_tag", "entity_type", "tag", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    entity_type = Column(String(10))
+    tag = Column(String(50))
+    digest = Column(String(64))
+    event_ids = Column(Text)
+
+    def __repr__(self):
+        return f"<DBPage(entity_type={self.entity_type}, tag={self.tag}, digest={self.digest})>"
+
+
+class DBSchemaVersion(Base):
+    __tablename__ = "schemaversion"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer)
+
+    def __repr__(self):
+        return f"<DBSchemaVersion(version={self.version})>"
+
+
+class DBOutboxMessage(Base):
+    __tablename__ = "outbox"
+    __table_args__ = (
+        Index("ix_outbox_idempotency_key", "idempotency_key", unique=True),
+        Index("ix_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    idempotency_key = Column(String(64))
+    recipient = Column(String(254))
+    subject = Column(String(100))
+    body = Column(Text)
+    status = Column(String(10))
+    attempts = Column(Integer)
+    claimed_by = Column(String(32))
+    next_attempt_at = Column(DateTime)
+    created_at = Column(DateTime)
+    sent_at = Column(DateTime)
+    last_error = Column(Text)
+
+    def __repr__(self):
+        return f"<DBOutboxMessage(recipient={self.recipient}, status={self.status}, attempts={self.attempts})>"
+
+
+class DBCrawlJob(Base):
+    __tablename__ = "crawljobs"
+    __table_args__ = (Index("ix_crawljobs_status", "status"),)
+
+    id = Column(Integer, primary_key=True)
+    status = Column(String(10))
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    def __repr__(self):
+        return f"<DBCrawlJob(id={self.id}, status={self.status}, started_at={self.started_at})>"
+
+
+class DBCrawlCheckpoint(Base):
+    __tablename__ = "crawlcheckpoints"
+    __table_args__ = (
+        Index(
+            "ix_crawlcheckpoints_job_id_entity_type_tag",
+            "job_id",
+            "entity_type",
+            "tag",
+            unique=True,
+        ),
+    )
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, ForeignKey("crawljobs.id"))
+    entity_type = Column(String(10))
+    tag = Column(String(50))
+
+    def __repr__(self):
+        return f"<DBCrawlCheckpoint(job_id={self.job_id}, entity_type={self.entity_type}, tag={self.tag})>"
+
+
+class DBCrawlShard(Base):
+    __tablename__ = "crawlshards"
+    __table_args__ = (
+        Index("ix_crawlshards_job_id_shard", "job_id", "shard", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, ForeignKey("crawljobs.id"))
+    shard = Column(Integer)
+    shards = Column(Integer)
+    status = Column(String(10))
+    claimed_by = Column(String(32))
+    lease_until = Column(DateTime)
+
+    def __repr__(self):
+        return f"<DBCrawlShard(job_id={self.job_id}, shard={self.shard}, status={self.status})>"
+
+
+class DBPendingEvent(Base):
+    __tablename__ = "pendingevents"
+    __table_args__ = (Index("ix_pendingevents_job_id", "job_id"),)
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, ForeignKey("crawljobs.id"))
+    payload = Column(Text)
+
+    def __repr__(self):
+        return f"<DBPendingEvent(job_id={self.job_id}, payload={self.payload})>"
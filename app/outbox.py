@@ -0,0 +1,119 @@
+import base64
+import datetime
+import hashlib
+import random
+import uuid
+
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from app.logger import Logger
+from app.metrics import metrics
+
+
+class Outbox:
+    SUBJECT = "New events on RA"
+
+    def __init__(self, db, batch_size=50, max_tries=4, retry_delay=60, lease=300):
+        self.db = db
+        self.batch_size = batch_size
+        self.max_tries = max_tries
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self.logger = Logger.get(__name__)
+
+    @classmethod
+    def from_config(cls, db, config):
+        return cls(
+            db,
+            batch_size=config.get("email_batch_size", 50),
+            max_tries=config.get("email_max_tries", 4),
+            retry_delay=config.get("email_retry_delay", 60),
+            lease=config.get("email_lease", 300),
+        )
+
+    def enqueue(self, recipient, body):
+        # The key makes enqueueing idempotent, a resumed or repeated run
+        # cannot queue the same email twice.
+        key = hashlib.sha256(f"{recipient}\n{body}".encode("utf-8")).hexdigest()
+        now = datetime.datetime.utcnow()
+        if self.db.enqueue_message(key, recipient, self.SUBJECT, body, now):
+            self.logger.info(f"Queued email to {recipient}")
+
+    def drain(self, make_service):
+        # Each claimed batch of due messages goes out as one Gmail batch
+        # request. Failures are rescheduled in the outbox rather than retried
+        # in place, so a later run or another worker picks them up.
+        service = None
+        token = uuid.uuid4().hex
+
+        while True:
+            now = datetime.datetime.utcnow()
+            messages = self.db.claim_messages(
+                token,
+                now,
+                now + datetime.timedelta(seconds=self.lease),
+                self.batch_size,
+            )
+            if not messages:
+                break
+            if service is None:
+                service = make_service()
+
+            errors = {}
+
+            def callback(request_id, response, exception):
+                if exception is not None:
+                    errors[int(request_id)] = exception
+
+            batch = service.new_batch_http_request(callback=callback)
+            for message in messages:
+                self.logger.info(f"Emailing {message.recipient}")
+                batch.add(
+                    service.users()
+                    .messages()
+                    .send(userId="me", body=self.raw_message(message)),
+                    request_id=str(message.id),
+                )
+            self.execute_batch(batch)
+
+            now = datetime.datetime.utcnow()
+            for message in messages:
+                message.claimed_by = None
+                if message.id not in errors:
+                    message.status = "sent"
+                    message.sent_at = now
+                    metrics.inc("emails_sent")
+                    continue
+                message.attempts += 1
+                message.last_error = str(errors[message.id])
+                if message.attempts >= self.max_tries:
+                    message.status = "failed"
+                    metrics.inc("emails_failed")
+                    self.logger.error(
+                        f"Could not email {message.recipient}: {message.last_error}"
+                    )
+                else:
+                    message.status = "pending"
+                    delay = random.uniform(0, self.retry_delay * 2**message.attempts)
+                    message.next_attempt_at = now + datetime.timedelta(seconds=delay)
+                    self.logger.warning(
+                        f"Emailing {message.recipient} failed, retrying in {delay:.0f}s"
+                    )
+            self.db.commit()
+
+    def raw_message(self, message):
+        mime = MIMEMultipart()
+        mime["From"] = "me"
+        mime["Subject"] = message.subject
+        mime["To"] = message.recipient
+        mime.attach(MIMEText(message.body, "html"))
+        return {"raw": base64.urlsafe_b64encode(mime.as_bytes()).decode()}
+
+    def execute_batch(self, batch):
+        # Imported here with the Gmail client, runs that find nothing to send
+        # never load either.
+        import backoff
+        from googleapiclient.errors import HttpError
+
+        backoff.on_exception(backoff.expo, HttpError, max_tries=4)(batch.execute)()
@@ -0,0 +1,72 @@
+from app.logger import Logger
+from app.metrics import metrics
+
+
+def has_class(*names):
+    # While parsing, the strainer sees the raw class attribute rather than
+    # the split list, so match on any of its words.
+    def match(value):
+        if value is None:
+            return False
+        classes = value.split() if isinstance(value, str) else value
+        return any(name in classes for name in names)
+
+    return match
+
+
+class Parser:
+    # Only the subtrees the scrapers look at are built, everything else on
+    # the page is skipped while parsing. bs4 is imported on the first parse,
+    # runs that only send emails never load it.
+    def __init__(self, backend="html.parser"):
+        self.logger = Logger.get(__name__)
+        self.backend = backend
+        self.strainers = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get("html_parser", "html.parser"))
+
+    def setup(self):
+        from bs4 import SoupStrainer
+        from bs4.builder import builder_registry
+
+        if builder_registry.lookup(self.backend) is None:
+            self.logger.warning(
+                f"HTML parser {self.backend} is not installed, using html.parser"
+            )
+            self.backend = "html.parser"
+        self.strainers = {
+            "events": SoupStrainer("article", class_=has_class("event-item")),
+            "tickets": SoupStrainer("li", class_=has_class("onsale")),
+            "favourites": SoupStrainer(class_=has_class("fav", "list")),
+        }
+
+    def parse(self, html, only=None):
+        from bs4 import BeautifulSoup
+
+        if self.strainers is None:
+            self.setup()
+        with metrics.timer("parse_seconds"):
+            return BeautifulSoup(
+                html, self.backend, parse_only=self.strainers.get(only)
+            )
+
+    def events(self, html):
+        # The tree is full of parent/child cycles and would otherwise wait for
+        # the garbage collector, so it is torn down once the caller is done.
+        soup = self.parse(html, "events")
+        try:
+            yield from soup.find_all("article", class_="event-item")
+        finally:
+            # After a strained parse the soup does not link to its elements,
+            # decompose() on it alone would leave them for the collector.
+            for element in list(soup.contents):
+                element.decompose()
+            soup.decompose()
+
+    def tickets(self, html):
+        return self.parse(html, "tickets").find_all("li", class_="onsale but")
+
+    def favourites(self, html):
+        return self.parse(html, "favourites")
@@ -0,0 +1,54 @@
+import random
+
+
+class PollSchedule:
+    # Every entity gets its own polling interval. It drops back to the
+    # minimum whenever the entity's page changes and grows geometrically
+    # while it stays the same, so busy clubs are checked often and dormant
+    # artists rarely.
+    JITTER = 0.1
+
+    def __init__(self, min_interval=900, max_interval=86400, backoff=2.0):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.intervals = {}
+        self.next_checks = {}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            min_interval=config.get("poll_min_interval", 900),
+            max_interval=config.get("poll_max_interval", 86400),
+            backoff=config.get("poll_backoff", 2.0),
+        )
+
+    def key(self, entity):
+        return (entity["type"], entity["tag"])
+
+    def due(self, entities, now):
+        # Entities seen for the first time are due straight away.
+        return [
+            entity
+            for entity in entities
+            if self.next_checks.get(self.key(entity), now) <= now
+        ]
+
+    def next_check(self, entities, now):
+        return min(
+            (self.next_checks.get(self.key(entity), now) for entity in entities),
+            default=now + self.min_interval,
+        )
+
+    def record(self, entity, changed, now):
+        key = self.key(entity)
+        if changed or key not in self.intervals:
+            interval = self.min_interval
+        else:
+            interval = min(self.max_interval, self.intervals[key] * self.backoff)
+        self.intervals[key] = interval
+        # A little jitter keeps entities that started together from being
+        # polled in one burst forever.
+        self.next_checks[key] = now + interval * random.uniform(
+            1 - self.JITTER, 1 + self.JITTER
+        )
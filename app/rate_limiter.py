@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+from app.logger import Logger
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                self.refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimiter:
+    # Additive increase, multiplicative decrease: one throttled or slow
+    # response halves a host's rate, healthy ones win it back slowly.
+    DECREASE_FACTOR = 0.5
+    INCREASE_STEP = 0.1
+
+    def __init__(
+        self, rate=5, burst=5, min_rate=0.5, max_rate=20, latency_threshold=5.0
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.latency_threshold = latency_threshold
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.logger = Logger.get(__name__)
+
+    @classmethod
+    def from_config(cls, config):
+        # Worker processes crawling side by side on one node split the
+        # budget, together they stay within the configured limits.
+        share = config.get("local_workers", 1)
+        return cls(
+            rate=config.get("rate_limit_per_host", 5) / share,
+            burst=max(1, config.get("rate_limit_burst", 5) / share),
+            min_rate=config.get("rate_limit_min", 0.5) / share,
+            max_rate=config.get("rate_limit_max", 20) / share,
+            latency_threshold=config.get("rate_limit_latency_threshold", 5.0),
+        )
+
+    def bucket(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.burst)
+            return self.buckets[host]
+
+    def acquire(self, url):
+        self.bucket(url).acquire()
+
+    def feedback(self, url, status_code, latency):
+        bucket = self.bucket(url)
+        with bucket.lock:
+            rate = bucket.rate
+            if (
+                status_code is None
+                or status_code == 429
+                or status_code >= 500
+                or latency > self.latency_threshold
+            ):
+                bucket.rate = max(self.min_rate, rate * self.DECREASE_FACTOR)
+            else:
+                bucket.rate = min(self.max_rate, rate + self.INCREASE_STEP)
+            changed = bucket.rate < rate
+
+        if changed:
+            self.logger.warning(
+                f"Slowing down {urlparse(url).netloc} to {bucket.rate:.2f} requests/s"
+            )
+
+    def rates(self):
+        with self.lock:
+            return {host: bucket.rate for host, bucket in self.buckets.items()}
+
+
+def schedule(urls):
+    # Round-robin over hosts so that every host's budget is being used at
+    # once, instead of draining one host's queue while the others sit idle.
+    queues = {}
+    for i, url in enumerate(urls):
+        queues.setdefault(urlparse(url).netloc, deque()).append(i)
+
+    order = []
+    queues = list(queues.values())
+    position = 0
+    while queues:
+        queue = queues[position % len(queues)]
+        order.append(queue.popleft())
+        if queue:
+            position += 1
+        else:
+            queues.remove(queue)
+    return order
@@ -0,0 +1,125 @@
+import base64
+import hashlib
+import json
+import os
+import random
+import time
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from app.logger import Logger
+
+
+def recording_path(directory, method, url):
+    key = hashlib.sha256(f"{method} {url}".encode("utf-8")).hexdigest()
+    return os.path.join(directory, f"{key}.json")
+
+
+def save_recording(directory, method, url, status, headers, body):
+    recording = {
+        "method": method,
+        "url": url,
+        "status": status,
+        "headers": headers,
+        "body": base64.b64encode(body).decode("ascii"),
+    }
+    path = recording_path(directory, method, url)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(recording, f)
+    os.replace(f"{path}.tmp", path)
+
+
+class RecordingAdapter(HTTPAdapter):
+    # Sends requests as usual and saves every response under its method and
+    # url, so a run can later be replayed without the network.
+    def __init__(self, directory, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        # A 304 only makes sense to the cache that asked for it, keep the
+        # full page recorded earlier.
+        if response.status_code != 304:
+            save_recording(
+                self.directory,
+                request.method,
+                request.url,
+                response.status_code,
+                dict(response.headers),
+                response.content,
+            )
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    # Answers requests from recordings, with optional latency and injected
+    # failures to exercise the retry and rate limiting paths.
+    def __init__(self, directory, latency=0, jitter=0, error_rate=0):
+        super().__init__()
+        self.directory = directory
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.logger = Logger.get(__name__)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config["replay_dir"],
+            latency=config.get("replay_latency", 0),
+            jitter=config.get("replay_jitter", 0),
+            error_rate=config.get("replay_error_rate", 0),
+        )
+
+    def send(self, request, **kwargs):
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if random.random() < self.error_rate:
+            if random.random() < 0.5:
+                raise requests.ConnectionError(f"Injected failure for {request.url}")
+            return self.build_response(request, 503, {}, b"")
+
+        path = recording_path(self.directory, request.method, request.url)
+        if not os.path.exists(path):
+            self.logger.warning(f"No recording of {request.method} {request.url}")
+            return self.build_response(request, 404, {}, b"")
+        with open(path) as f:
+            recording = json.load(f)
+
+        headers = CaseInsensitiveDict(recording["headers"])
+        etag = headers.get("ETag")
+        if etag is not None and request.headers.get("If-None-Match") == etag:
+            return self.build_response(request, 304, {"ETag": etag}, b"")
+        # The recorded body is already decoded, its length and encoding
+        # headers no longer apply.
+        headers = {
+            name: value
+            for name, value in headers.items()
+            if name.lower()
+            not in ("content-encoding", "content-length", "transfer-encoding")
+        }
+        return self.build_response(
+            request,
+            recording["status"],
+            headers,
+            base64.b64decode(recording["body"]),
+        )
+
+    def build_response(self, request, status, headers, body):
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = body
+        response.url = request.url
+        response.request = request
+        response.reason = "Replayed"
+        return response
+
+    def close(self):
+        pass
@@ -0,0 +1,15 @@
+import zlib
+
+
+def shard_of(tag, shards):
+    # crc32 rather than hash(), which is salted differently in every process.
+    return zlib.crc32(tag.encode("utf-8")) % shards
+
+
+def crawl_worker(config):
+    # Entry point of the local worker processes. Each one builds its own App
+    # and with it its own database session and HTTP pool.
+    from app.app import App
+    from app.config import Config
+
+    return App(Config(data=config)).crawl_worker()
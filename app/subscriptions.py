@@ -0,0 +1,83 @@
+from collections import deque
+
+
+class LocationMatcher:
+    # Aho-Corasick automaton over every user's locations, so that an event
+    # venue is scanned once no matter how many locations there are.
+    def __init__(self, locations):
+        self.transitions = [{}]
+        self.fail = [0]
+        self.matches = [set()]
+
+        for location in locations:
+            state = 0
+            for char in location:
+                if char not in self.transitions[state]:
+                    self.transitions.append({})
+                    self.fail.append(0)
+                    self.matches.append(set())
+                    self.transitions[state][char] = len(self.transitions) - 1
+                state = self.transitions[state][char]
+            self.matches[state].add(location)
+
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.transitions[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.transitions[fallback].get(char, 0)
+                self.matches[child] |= self.matches[self.fail[child]]
+
+    def find(self, text):
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in self.transitions[state]:
+                state = self.fail[state]
+            state = self.transitions[state].get(char, 0)
+            found |= self.matches[state]
+        return found
+
+
+class SubscriptionIndex:
+    def __init__(self, users):
+        self.subscribers = {}
+        locations = set()
+
+        for user in users:
+            for venue in user.venues:
+                self.subscribe(("venue", venue["name"]), user)
+            for artist in user.artists:
+                self.subscribe(("artist", artist["name"]), user)
+            for promoter in user.promoters:
+                self.subscribe(("promoter", promoter["name"]), user)
+            locations.update(user.locations)
+
+        self.locations = LocationMatcher(locations)
+
+    def subscribe(self, key, user):
+        subscribers = self.subscribers.setdefault(key, [])
+        if not subscribers or subscribers[-1] is not user:
+            subscribers.append(user)
+
+    def get(self, event):
+        if event.event_type == "venue":
+            return self.subscribers.get(("venue", event.venue), [])
+        if event.event_type == "promoter":
+            return self.subscribers.get(("promoter", event.promoter), [])
+        if event.event_type == "artist":
+            subscribers = self.subscribers.get(("artist", event.artist), [])
+            if not subscribers:
+                return []
+            # Users without a location preference are notified wherever the
+            # artist plays, the rest only if one of their locations matches.
+            matched = self.locations.find(event.venue)
+            return [
+                user
+                for user in subscribers
+                if not user.locations or matched.intersection(user.locations)
+            ]
+        return []
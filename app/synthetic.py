@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import random
+
+from app.replay import save_recording
+
+EVENT_URL_PREFIX = "https://www.residentadvisor.net/events/"
+LOCATIONS = ["London", "Berlin", "Paris", "Amsterdam", "Ibiza", "New York"]
+
+
+def event_article(event_id, venue="Fabric", location="London"):
+    return (
+        f'<article class="event-item"><a href="/events/{event_id}">link</a>'
+        f'<span class="title">Night {event_id}</span>'
+        '<div class="bbox"><h1 class="title">Sat, 1 Jun 2030 '
+        "<span>x</span><span>y</span>"
+        f'<span><a href="/club.aspx?id=1">{venue}</a><a href="#">{location}</a></span>'
+        "</h1></div>"
+        '<div class="event-lineup">DJ A, DJ B</div></article>'
+    )
+
+
+def listing_page(articles):
+    return f"<html><body><nav>menu</nav><main>{''.join(articles)}</main></body></html>"
+
+
+def event_page(event_id):
+    # Every other event has tickets on sale.
+    if int(event_id) % 2:
+        return (
+            '<html><ul><li class="onsale but"><p>Early bird <span>£10</span></p>'
+            "</li></ul></html>"
+        )
+    return "<html><ul></ul></html>"
+
+
+def profile_page(artists, venues, promoters):
+    # Follows are (name, tag) pairs, laid out the way parse_favourites reads
+    # them.
+    artists = "".join(
+        f'<div class="fav"><div class="pb2"><a href="/dj/{tag}">{name}</a></div></div>'
+        for name, tag in artists
+    )
+    venues = "".join(
+        f'<li><a href="#">i</a><a href="/club.aspx?id={tag}">{name}</a></li>'
+        for name, tag in venues
+    )
+    promoters = "".join(
+        f'<li><a href="#">i</a><a href="/promoter.aspx?id={tag}">{name}</a></li>'
+        for name, tag in promoters
+    )
+    return (
+        f'<html>{artists}<ul class="list venueListing">{venues}</ul>'
+        '<ul class="list"><li><a>x</a><a href="/label.aspx?id=1">Label</a></li></ul>'
+        f'<ul class="list">{promoters}</ul></html>'
+    )
+
+
+class SyntheticSite:
+    # A made-up RA of any size, written as recordings for ReplayAdapter so
+    # that runs can be benchmarked beyond what was ever recorded. Users
+    # follow entities from a shared pool and listings share events, as on
+    # the real site.
+    def __init__(self, users=20, follows=15, events=10, seed=0):
+        self.users = users
+        self.follows = follows
+        self.events = events
+        self.random = random.Random(seed)
+
+    @classmethod
+    def scaled(cls, scale, seed=0):
+        # Users, and with them follows, listings and events, grow linearly.
+        return cls(users=20 * scale, seed=seed)
+
+    def write(self, directory, config):
+        # Returns the path of the users file that goes with the recordings.
+        os.makedirs(directory, exist_ok=True)
+        pool = max(self.follows, self.users * self.follows // 10)
+        entities = {
+            entity_type: [(f"{entity_type} {i}", f"{i}") for i in range(pool)]
+            for entity_type in ("artist", "venue", "promoter")
+        }
+
+        self.record(directory, "POST", config["login_url"], "ok")
+        users = []
+        followed = set()
+        for i in range(self.users):
+            follows = {
+                entity_type: self.random.sample(
+                    entities[entity_type], self.follows // 3 or 1
+                )
+                for entity_type in entities
+            }
+            for entity_type, chosen in follows.items():
+                followed.update((entity_type, tag) for _, tag in chosen)
+            nickname = f"user{i}"
+            self.record(
+                directory,
+                "GET",
+                f"{config['profile_url_prefix']}{nickname}/favourites",
+                profile_page(follows["artist"], follows["venue"], follows["promoter"]),
+            )
+            users.append(
+                {
+                    "name": f"User {i}",
+                    "nickname": nickname,
+                    "email": f"{nickname}@example.com",
+                    "locations": self.random.sample(
+                        LOCATIONS, self.random.randint(0, 2)
+                    ),
+                }
+            )
+
+        event_ids = set()
+        span = max(self.events, pool * self.events // 4)
+        for entity_type, tag in sorted(followed):
+            # Listing contents follow from the tag, so every run of the
+            # benchmark finds the same pages.
+            base = int(hashlib.md5(f"{entity_type}{tag}".encode()).hexdigest(), 16)
+            ids = [1000000 + (base + i) % span for i in range(self.events)]
+            event_ids.update(ids)
+            self.record(
+                directory,
+                "GET",
+                f"{config[entity_type + '_url_prefix']}{tag}",
+                listing_page(
+                    event_article(event_id, location=LOCATIONS[event_id % 6])
+                    for event_id in ids
+                ),
+            )
+        for event_id in event_ids:
+            self.record(
+                directory,
+                "GET",
+                f"{EVENT_URL_PREFIX}{event_id}",
+                event_page(event_id),
+            )
+
+        users_path = os.path.join(directory, "users.json")
+        with open(users_path, "w") as f:
+            json.dump({"users": users}, f)
+        return users_path
+
+    def record(self, directory, method, url, page):
+        body = page.encode("utf-8")
+        headers = {
+            "Content-Type": "text/html; charset=utf-8",
+            "ETag": '"%s"' % hashlib.md5(body).hexdigest(),
+        }
+        save_recording(directory, method, url, 200, headers, body)
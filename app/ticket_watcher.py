@@ -0,0 +1,67 @@
+import datetime
+import heapq
+
+
+class TicketWatcher:
+    # Events still waiting for tickets are rechecked on their own instead of
+    # only when a listing shows them again. The closer the event, the more
+    # often its page is checked, so tickets going on sale for this weekend
+    # are noticed first.
+    def __init__(self, min_interval=600, max_interval=21600, batch_size=50):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.batch_size = batch_size
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            min_interval=config.get("ticket_watch_min_interval", 600),
+            max_interval=config.get("ticket_watch_max_interval", 21600),
+            batch_size=config.get("ticket_watch_batch_size", 50),
+        )
+
+    def interval(self, event_date, now):
+        # Events without a parsed date are checked as rarely as possible.
+        if event_date is None:
+            return self.max_interval
+        days = max((event_date - now.date()).days, 0)
+        return min(self.max_interval, self.min_interval * (days + 1))
+
+    def windows(self, now):
+        # Dates sharing an interval, as (first date, last date, checked
+        # before): one window for each day until the interval reaches its
+        # maximum, one for every later day and one for undated events.
+        today = now.date()
+        days = 0
+        while self.min_interval * (days + 1) < self.max_interval:
+            date = today + datetime.timedelta(days=days)
+            yield date, date, now - datetime.timedelta(
+                seconds=self.min_interval * (days + 1)
+            )
+            days += 1
+        checked_before = now - datetime.timedelta(seconds=self.max_interval)
+        yield today + datetime.timedelta(days=days), None, checked_before
+        yield None, None, checked_before
+
+    def next_check(self, event, now):
+        if event.last_checked is None:
+            return now
+        return event.last_checked + datetime.timedelta(
+            seconds=self.interval(event.event_date, now)
+        )
+
+    def due(self, events, now):
+        # Most overdue first, ties broken by the earlier event.
+        queue = [
+            (self.next_check(event, now), event.event_date or datetime.date.max, i)
+            for i, event in enumerate(events)
+        ]
+        heapq.heapify(queue)
+
+        due = []
+        while queue and len(due) < self.batch_size:
+            next_check, _, i = heapq.heappop(queue)
+            if next_check > now:
+                break
+            due.append(events[i])
+        return due
@@ -10,7 +10,11 @@ class User:
         self.artists = []
         self.venues = []
         self.promoters = []
-        self.email_body = EmailBody(name)
+        self.favourites_digest = None
+        self.reset_email()
+
+    def reset_email(self):
+        self.email_body = EmailBody(self.name)
         self.number_of_new_events = 0
 
     def add_artist(self, artist_name, artist_tag):
@@ -22,29 +26,10 @@ class User:
     def add_promoter(self, promoter_name, promoter_tag):
         self.promoters.append({"name": promoter_name, "tag": promoter_tag})
 
-    def add_to_email(self, event):
-        if event.event_type == "venue":
-            if any(venue["name"] == event.venue for venue in self.venues):
-                self.email_body.add_venue_event(event)
-                self.email_body.add_tickets(event.tickets)
-                self.number_of_new_events += 1
-        elif event.event_type == "artist":
-            if any(artist["name"] == event.artist for artist in self.artists):
-                if not self.locations:  # notify if no location preference specified
-                    self.email_body.add_artist_event(event)
-                    self.email_body.add_tickets(event.tickets)
-                    self.number_of_new_events += 1
-                    return
-                for location in self.locations:  # notify if location preference matches
-                    if location in event.venue:
-                        self.email_body.add_artist_event(event)
-                        self.email_body.add_tickets(event.tickets)
-                        self.number_of_new_events += 1
-        elif event.event_type == "promoter":
-            if any(promoter["name"] == event.promoter for promoter in self.promoters):
-                self.email_body.add_promoter_event(event)
-                self.email_body.add_tickets(event.tickets)
-                self.number_of_new_events += 1
+    def add_to_email(self, fragment):
+        # Whether the user follows the event is decided by SubscriptionIndex.
+        self.email_body.add_fragment(fragment)
+        self.number_of_new_events += 1
 
     def add_email_ending(self):
         venues_list = ", ".join(venue["name"] for venue in self.venues)
@@ -1,4 +1,96 @@
+import argparse
+import tempfile
+
 from app.app import App
+from app.config import Config
+from app.synthetic import SyntheticSite
+
+parser = argparse.ArgumentParser(description="Notify users about new RA events.")
+parser.add_argument(
+    "--prune",
+    action="store_true",
+    help="delete past events from the database instead of checking for new ones",
+)
+parser.add_argument(
+    "--vacuum", action="store_true", help="compact the SQLite database after pruning"
+)
+parser.add_argument(
+    "--send",
+    action="store_true",
+    help="only send the emails waiting in the outbox",
+)
+parser.add_argument(
+    "--daemon",
+    action="store_true",
+    help="keep running and poll each venue, artist and promoter on its own schedule",
+)
+parser.add_argument(
+    "--watch-tickets",
+    action="store_true",
+    help="only recheck the events that are still waiting for tickets",
+)
+parser.add_argument(
+    "--shards",
+    type=int,
+    help="split the crawl into this many shards crawled by worker processes",
+)
+parser.add_argument(
+    "--crawl-worker",
+    action="store_true",
+    help="crawl shards of the running sharded crawl job, e.g. on another node",
+)
+parser.add_argument(
+    "--record", metavar="DIR", help="save every HTTP response into DIR for --replay"
+)
+parser.add_argument(
+    "--replay",
+    metavar="DIR",
+    help="answer HTTP requests from the responses recorded in DIR",
+)
+parser.add_argument(
+    "--benchmark",
+    type=int,
+    metavar="RUNS",
+    help="time this many full runs, each on an empty database, usually with --replay",
+)
+parser.add_argument(
+    "--scale",
+    type=int,
+    metavar="N",
+    help="replay a synthetic site with N times 20 users instead of recordings",
+)
+
+# Worker processes are spawned and import this module again, only the
+# parent may parse the command line and run.
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    config = Config(App.CONFIG_PATH)
+    if args.record:
+        config["record_dir"] = args.record
+    if args.replay:
+        config["replay_dir"] = args.replay
+    if args.scale:
+        # Removed when the process exits.
+        site = tempfile.TemporaryDirectory()
+        config["replay_dir"] = site.name
+        config["users_path"] = SyntheticSite.scaled(args.scale).write(site.name, config)
+    if args.benchmark:
+        # The HTTP cache would turn every run after the first into 304s.
+        config["http_cache_path"] = None
 
-app = App()
-app.main()
+    app = App(config)
+    if args.prune:
+        app.prune(vacuum=args.vacuum)
+    elif args.send:
+        app.send_emails()
+    elif args.watch_tickets:
+        app.watch()
+    elif args.daemon:
+        app.daemon()
+    elif args.crawl_worker:
+        app.crawl_worker()
+    elif args.benchmark:
+        app.benchmark(args.benchmark, shards=args.shards)
+    else:
+        app.main(shards=args.shards)
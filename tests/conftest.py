@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from app.app import App
+from app.config import Config
+from app.database import Database
+from tests.gmail import FakeGmail
+from tests.site import StandInServer
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--run-slow", action="store_true", help="run the production size benchmarks"
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--run-slow"):
+        return
+    skip = pytest.mark.skip(reason="needs --run-slow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def server():
+    server = StandInServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def db(tmp_path):
+    return Database.from_url(f"sqlite:///{tmp_path}/database.db")
+
+
+@pytest.fixture
+def gmail():
+    return FakeGmail()
+
+
+@pytest.fixture
+def users_path(tmp_path):
+    path = tmp_path / "users.json"
+    path.write_text(
+        json.dumps(
+            {
+                "users": [
+                    {"name": "A", "nickname": "a", "email": "a@x", "locations": []},
+                    {
+                        "name": "B",
+                        "nickname": "b",
+                        "email": "b@x",
+                        "locations": ["London"],
+                    },
+                ]
+            }
+        )
+    )
+    return str(path)
+
+
+@pytest.fixture
+def make_app(server, tmp_path, users_path):
+    def make_app(**overrides):
+        config = server.config(
+            database_url=f"sqlite:///{tmp_path}/database.db",
+            users_path=users_path,
+            send_after_run=False,
+        )
+        config.update(overrides)
+        app = App(Config(data=config))
+        server.forward(app.crawler.client.session)
+        return app
+
+    return make_app
@@ -0,0 +1,50 @@
+import base64
+import email
+import time
+
+
+class FakeGmail:
+    # Stands in for the Gmail service built by App.make_service, answering
+    # batch requests with a failure for the recipients listed in fail.
+    def __init__(self, latency=0):
+        # Seconds each batch request takes, as one round trip to Gmail.
+        self.latency = latency
+        self.sent = []
+        self.batches = []
+        # Recipient -> number of sends that fail before one succeeds.
+        self.fail = {}
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(self, callback)
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def send(self, userId, body):
+        return email.message_from_bytes(base64.urlsafe_b64decode(body["raw"]))
+
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request, request_id))
+
+    def execute(self):
+        if self.service.latency:
+            time.sleep(self.service.latency)
+        self.service.batches.append(len(self.requests))
+        for message, request_id in self.requests:
+            recipient = message["To"]
+            if self.service.fail.get(recipient, 0) > 0:
+                self.service.fail[recipient] -= 1
+                self.callback(request_id, None, Exception(f"Rejected {recipient}"))
+            else:
+                self.service.sent.append(message)
+                self.callback(request_id, {"id": request_id}, None)
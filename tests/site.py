@@ -0,0 +1,190 @@
+import hashlib
+import http.server
+import socketserver
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+
+from app import synthetic
+
+RA_URL = "https://www.residentadvisor.net"
+
+
+def listing_event_ids(entity_type, tag, events=5):
+    # Listings overlap, as real ones do when an artist plays a followed club.
+    base = int(hashlib.md5(f"{entity_type}{tag}".encode()).hexdigest()[:4], 16) % 50
+    return [str(1000000 + base + i) for i in range(events)]
+
+
+def listing_page(entity_type, tag, events=5):
+    return synthetic.listing_page(
+        synthetic.event_article(event_id)
+        for event_id in listing_event_ids(entity_type, tag, events)
+    )
+
+
+def profile_page(follows=3):
+    return synthetic.profile_page(
+        [(f"DJ {i}", f"dj{i}") for i in range(follows)],
+        [(f"Club {i}", f"{i}") for i in range(follows)],
+        [(f"Promoter {i}", f"{i}") for i in range(follows)],
+    )
+
+
+class ForwardingAdapter(HTTPAdapter):
+    # Event urls are built from the real site's address, this sends them to
+    # the stand-in server instead.
+    def __init__(self, url):
+        super().__init__()
+        self.url = url
+
+    def send(self, request, **kwargs):
+        request.url = self.url + request.url[len(RA_URL) :]
+        return super().send(request, **kwargs)
+
+
+class StandInServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    # A local RA lookalike serving listings, event and profile pages with
+    # ETags, a configurable latency and scripted failures.
+    daemon_threads = True
+
+    def __init__(self, latency=0, events=5, follows=3):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.latency = latency
+        self.events = events
+        self.follows = follows
+        # Path prefix -> extra latency, e.g. to slow down event pages only.
+        self.delays = {}
+        # Path -> responses (status, headers) returned before the real page.
+        self.scripts = {}
+        # Path -> page served instead of the generated one.
+        self.pages = {}
+        self.hits = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # TCP connections accepted, kept-alive ones are counted once, and
+        # the time each one takes to set up, standing in for the TCP and TLS
+        # handshakes of the real site.
+        self.connections = 0
+        self.handshake = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def config(self, **overrides):
+        config = {
+            "login_url": f"{self.url}/login",
+            "payload": {},
+            "profile_url_prefix": f"{self.url}/profile/",
+            "venue_url_prefix": f"{self.url}/club.aspx?id=",
+            "artist_url_prefix": f"{self.url}/dj/",
+            "promoter_url_prefix": f"{self.url}/promoter.aspx?id=",
+            "rate_limit_per_host": 1000,
+            "rate_limit_burst": 1000,
+            "rate_limit_max": 1000,
+        }
+        config.update(overrides)
+        return config
+
+    def forward(self, session):
+        session.mount(f"{RA_URL}/", ForwardingAdapter(self.url))
+
+    def script(self, path, *responses):
+        self.scripts[path] = list(responses)
+
+    def page(self, path):
+        if path in self.pages:
+            return self.pages[path]
+        if path.startswith("/profile/"):
+            return profile_page(self.follows)
+        if path.startswith("/club.aspx?id="):
+            return listing_page("venue", path.split("=", 1)[1], self.events)
+        if path.startswith("/dj/"):
+            return listing_page("artist", path[len("/dj/") :], self.events)
+        if path.startswith("/promoter.aspx?id="):
+            return listing_page("promoter", path.split("=", 1)[1], self.events)
+        if path.startswith("/events/"):
+            return synthetic.event_page(path[len("/events/") :])
+        return None
+
+    def get_request(self):
+        request = super().get_request()
+        with self.lock:
+            self.connections += 1
+        if self.handshake:
+            time.sleep(self.handshake)
+        return request
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, with Nagle's algorithm every
+    # kept-alive response would wait for a delayed ACK.
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, headers=(), body=b""):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send(200, [("Set-Cookie", "session=1")], b"ok")
+
+    def do_GET(self):
+        server = self.server
+        path = urlparse(self.path)._replace(scheme="", netloc="").geturl()
+        with server.lock:
+            server.hits[path] += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            scripted = server.scripts.get(path)
+            response = scripted.pop(0) if scripted else None
+        try:
+            delay = server.latency + sum(
+                extra
+                for prefix, extra in server.delays.items()
+                if path.startswith(prefix)
+            )
+            if delay:
+                time.sleep(delay)
+
+            if response is not None:
+                status, headers = response
+                self.send(status, list(headers.items()))
+                return
+
+            page = server.page(path)
+            if page is None:
+                self.send(404, body=b"not found")
+                return
+            body = page.encode("utf-8")
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            if self.headers.get("If-None-Match") == etag:
+                self.send(304, [("ETag", etag)])
+            else:
+                self.send(200, [("ETag", etag)], body)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
@@ -0,0 +1,254 @@
+import datetime
+import threading
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import synthetic
+from app.event_registry import EventRegistry
+from app.models import DBCrawlJob, DBCrawlShard, DBEvent
+
+VENUE = {"type": "venue", "tag": "1", "name": "Club 1"}
+
+
+def event_hits(server):
+    return sum(count for path, count in server.hits.items() if "/events/" in path)
+
+
+def test_unchanged_pages_are_skipped(server, make_app):
+    app = make_app()
+    db = app.connect()
+    app.crawl(db, [VENUE], watched=True)
+    db.commit()
+    pending = db.session.query(DBEvent).filter(DBEvent.tickets_available.isnot(True))
+    assert pending.count()
+    app.registry = EventRegistry()
+    server.hits.clear()
+
+    new_events = app.crawl(db, [VENUE], watched=True)
+
+    # Events still waiting for tickets are left to the ticket watcher.
+    assert new_events == []
+    assert event_hits(server) == 0
+
+
+def test_unwatched_events_of_unchanged_pages_are_rechecked(server, make_app):
+    app = make_app()
+    db = app.connect()
+    app.crawl(db, [VENUE])
+    db.commit()
+    pending = db.session.query(DBEvent).filter(DBEvent.tickets_available.isnot(True))
+    waiting = {event.event_id for event in pending}
+    assert waiting
+    app.registry = EventRegistry()
+    server.hits.clear()
+
+    new_events = app.crawl(db, [VENUE])
+
+    # Only the waiting events' ticket pages, the listing was not parsed.
+    assert new_events == []
+    assert event_hits(server) == len(waiting)
+
+
+def test_tickets_going_on_sale_are_notified_by_the_next_run(server, make_app, gmail):
+    app = make_app(send_after_run=True)
+    app.make_service = lambda: gmail
+    app.main()
+    db = app.connect()
+    waiting = [
+        event.event_id
+        for event in db.session.query(DBEvent).filter(
+            DBEvent.tickets_available.isnot(True)
+        )
+    ]
+    assert waiting
+    for event_id in waiting:
+        server.pages[f"/events/{event_id}"] = synthetic.event_page("1")
+    sent = len(gmail.sent)
+
+    app.main()
+
+    assert len(gmail.sent) > sent
+    db.session.expire_all()
+    assert not db.session.query(DBEvent).filter(
+        DBEvent.tickets_available.isnot(True)
+    ).count()
+
+
+def test_unchanged_pages_with_events_missing_a_payload_are_parsed(server, make_app):
+    app = make_app()
+    db = app.connect()
+    app.crawl(db, [VENUE])
+    db.session.query(DBEvent).update({"payload": None})
+    db.commit()
+    app.registry = EventRegistry()
+    server.hits.clear()
+
+    app.crawl(db, [VENUE])
+
+    assert event_hits(server) > 0
+    assert not db.has_unwatched_events(
+        "venue", [event.event_id for event in db.session.query(DBEvent)]
+    )
+
+
+class StopDaemon(Exception):
+    pass
+
+
+class DaemonClock:
+    # Stands in for the daemon's time module: sleeping moves the clock on
+    # at once and the daemon is stopped after a number of ticks.
+    def __init__(self, server, ticks):
+        self.server = server
+        self.ticks = ticks
+        self.now = 0
+        self.sleeps = []
+        self.fetches = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.fetches.append(self.server.hits["/club.aspx?id=0"])
+        if len(self.sleeps) == self.ticks:
+            raise StopDaemon()
+        self.now += seconds
+
+
+def test_daemon_polls_unchanged_entities_less_often(server, make_app, monkeypatch):
+    monkeypatch.setattr("app.poll_schedule.random.uniform", lambda low, high: 1)
+    clock = DaemonClock(server, ticks=8)
+    monkeypatch.setattr("app.app.time", clock)
+    app = make_app(poll_min_interval=100, poll_max_interval=400, daemon_max_sleep=60)
+
+    with pytest.raises(StopDaemon):
+        app.daemon()
+
+    # Listings are checked at 0s, after 100s and then 200s more.
+    assert clock.sleeps == [60, 40, 60, 60, 60, 20, 60, 60]
+    assert clock.fetches == [1, 1, 2, 2, 2, 2, 3, 3]
+    # Every tick that crawled finished a job, only the last one is kept.
+    db = app.connect()
+    assert db.session.query(DBCrawlJob).count() == 1
+
+
+def test_crawl_fetches_pages_outside_of_write_transactions(server, make_app):
+    app = make_app(checkpoint_batch_size=2)
+    db = app.connect()
+    job = app.start_job(db)
+    db.commit()
+    fetch_all = app.crawler.fetch_all
+    fetches = []
+
+    def checked_fetch_all(urls):
+        fetches.append(db.session.connection().connection.in_transaction)
+        return fetch_all(urls)
+
+    app.crawler.fetch_all = checked_fetch_all
+    entities = [
+        {"type": "artist", "tag": f"dj{i}", "name": f"DJ {i}"} for i in range(5)
+    ]
+    new_events = app.crawl(db, entities, job)
+
+    assert new_events
+    # A listing and a ticket fetch for each of the three batches.
+    assert fetches == [False] * 6
+
+
+def test_sharded_workers_share_an_sqlite_database(server, make_app):
+    # Slow ticket pages kept the first worker's write transaction open for
+    # longer than the others wait for the lock.
+    server.follows = 7
+    server.delays["/events/"] = 0.6
+    app = make_app()
+    db = app.connect()
+    users = app.update_users_preferences(db)
+    job = app.start_job(db)
+    db.create_shards(job.id, 2)
+    db.commit()
+
+    crawled = []
+    workers = [
+        threading.Thread(target=lambda: crawled.append(make_app().crawl_worker()))
+        for _ in range(2)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sum(crawled) == 2
+    assert db.count_unfinished_shards(job.id) == 0
+    app.finish_run(db, users, job)
+    assert db.session.query(DBEvent).count() == len(
+        {(event.event_id, event.event_type) for event in db.session.query(DBEvent)}
+    )
+
+
+def test_shards_of_dead_workers_are_crawled_once_their_lease_ran_out(make_app):
+    app = make_app(crawl_workers=0, shard_poll_interval=0.1)
+    db = app.connect()
+    users = app.update_users_preferences(db)
+    job = app.start_job(db)
+    db.create_shards(job.id, 2)
+    # Claimed by a worker on another node, which then died.
+    now = datetime.datetime.utcnow()
+    db.claim_shard(job.id, "dead", now, now + datetime.timedelta(seconds=0.5))
+
+    app.run_sharded(db, users, 2)
+
+    assert db.session.query(DBCrawlShard).count() == 0
+    assert job.status == "finished"
+    assert db.session.query(DBEvent).count()
+
+
+def test_a_persistent_error_fails_the_shard(make_app, monkeypatch):
+    monkeypatch.setattr("app.app.random.uniform", lambda low, high: 0)
+    app = make_app(shard_max_tries=3)
+    db = app.connect()
+    app.update_users_preferences(db)
+    job = app.start_job(db)
+    db.create_shards(job.id, 1)
+    tries = []
+
+    def crawl(db, entities, job):
+        tries.append(entities)
+        raise IntegrityError("INSERT", {}, Exception("UNIQUE constraint failed"))
+
+    app.crawl = crawl
+
+    with pytest.raises(IntegrityError):
+        app.crawl_worker()
+
+    assert len(tries) == 3
+    # Given back, so that another worker can try again.
+    db.session.expire_all()
+    shard = db.session.query(DBCrawlShard).one()
+    assert (shard.status, shard.claimed_by) == ("pending", None)
+
+
+def test_gmail_discovery_document_is_downloaded_once(tmp_path, monkeypatch, make_app):
+    path = tmp_path / "gmail_discovery.json"
+    app = make_app(gmail_discovery_path=str(path))
+    requested = []
+
+    class Response:
+        text = '{"name": "gmail"}'
+
+        def raise_for_status(self):
+            pass
+
+    def get(url, timeout):
+        requested.append(url)
+        return Response()
+
+    monkeypatch.setattr("app.app.requests.get", get)
+    # RA's rate limits, retries and recordings do not apply to Google.
+    app.crawler.client = None
+
+    assert app.gmail_discovery_document() == '{"name": "gmail"}'
+    assert app.gmail_discovery_document() == '{"name": "gmail"}'
+    assert len(requested) == 1
+    assert path.read_text() == '{"name": "gmail"}'
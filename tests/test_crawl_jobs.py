@@ -0,0 +1,106 @@
+import datetime
+import json
+import re
+
+import pytest
+
+from app.models import DBCrawlJob
+
+HOURS = datetime.timedelta(hours=1)
+VENUE = {"type": "venue", "tag": "1", "name": "Club 1"}
+
+
+def listing_hits(server):
+    return {path: count for path, count in server.hits.items() if "/events/" not in path}
+
+
+def event_urls(gmail):
+    # Each user's emailed events, by the url every event ends with.
+    return {
+        message["To"]: sorted(
+            re.findall(r"/events/\d+", message.get_payload()[0].get_payload())
+        )
+        for message in gmail.sent
+    }
+
+
+def crash_on_second_listing_batch(app):
+    fetch_all = app.crawler.fetch_all
+    batches = []
+
+    def failing_fetch_all(urls):
+        if not any("/events/" in url or "/profile/" in url for url in urls):
+            batches.append(urls)
+            if len(batches) == 2:
+                raise RuntimeError("network down")
+        return fetch_all(urls)
+
+    app.crawler.fetch_all = failing_fetch_all
+
+
+def test_a_crashed_run_resumes_where_it_stopped(server, make_app, gmail, tmp_path):
+    # The same run without the crash, on a database of its own.
+    expected = make_app(
+        database_url=f"sqlite:///{tmp_path}/expected.db", send_after_run=True
+    )
+    expected_gmail = type(gmail)()
+    expected.make_service = lambda: expected_gmail
+    expected.main()
+    pages = set(listing_hits(server))
+
+    app = make_app(checkpoint_batch_size=2, send_after_run=True)
+    app.make_service = lambda: gmail
+    crash_on_second_listing_batch(app)
+    with pytest.raises(RuntimeError):
+        app.main()
+    assert gmail.sent == []
+    server.hits.clear()
+
+    restarted = make_app(checkpoint_batch_size=2, send_after_run=True)
+    restarted.make_service = lambda: gmail
+    restarted.main()
+
+    # Profiles are downloaded again, the two listings of the first batch were
+    # checkpointed with their events.
+    assert len(pages - set(listing_hits(server))) == 2
+    assert event_urls(gmail) == event_urls(expected_gmail)
+    assert len(gmail.sent) == len(expected_gmail.sent)
+
+
+def test_names_sharing_a_tag_are_checkpointed_once(make_app):
+    app = make_app()
+    db = app.connect()
+    entities = [VENUE, dict(VENUE, name="Club One")]
+
+    app.run(db, [], entities)
+    app.run(db, [], entities)
+
+    assert [job.status for job in db.session.query(DBCrawlJob)] == ["finished"]
+
+
+def test_a_recent_running_job_is_resumed(db):
+    now = datetime.datetime.utcnow()
+    job = db.start_crawl_job(now - HOURS, 6 * HOURS)
+    db.checkpoint_entity(job.id, "venue", "1")
+    db.commit()
+
+    resumed = db.start_crawl_job(now, 6 * HOURS)
+
+    assert resumed.id == job.id
+    assert db.completed_entities(job.id) == {("venue", "1")}
+
+
+def test_an_old_running_job_is_abandoned_with_its_events_kept(db):
+    now = datetime.datetime.utcnow()
+    job = db.start_crawl_job(now - 10 * HOURS, 6 * HOURS)
+    db.checkpoint_entity(job.id, "venue", "1")
+    db.add_pending_events(job.id, [json.dumps({"event_id": "1"})])
+    db.commit()
+
+    new_job = db.start_crawl_job(now, 6 * HOURS)
+
+    assert new_job.id != job.id
+    assert job.status == "abandoned"
+    # Its entities are crawled again, its events are still to be notified.
+    assert db.completed_entities(new_job.id) == set()
+    assert db.pending_events(new_job.id) == [json.dumps({"event_id": "1"})]
@@ -0,0 +1,47 @@
+import time
+
+from app.config import Config
+from app.crawler import Crawler
+from tests.site import listing_page
+
+
+def make_crawler(server, **overrides):
+    return Crawler.from_config(Config(data=server.config(**overrides)))
+
+
+def test_fetch_all_keeps_the_order_of_urls(server):
+    crawler = make_crawler(server)
+    tags = [str(tag) for tag in range(20)]
+
+    pages = crawler.fetch_all([f"{server.url}/dj/{tag}" for tag in tags])
+
+    assert pages == [listing_page("artist", tag) for tag in tags]
+
+
+def test_fetch_all_respects_the_per_host_limit(server):
+    server.latency = 0.05
+    crawler = make_crawler(server, max_concurrency=8, max_per_host_concurrency=3)
+
+    crawler.fetch_all([f"{server.url}/dj/{tag}" for tag in range(12)])
+
+    assert server.max_in_flight == 3
+
+
+def test_fetch_all_is_faster_than_fetching_in_turn(server):
+    server.latency = 0.05
+    urls = [f"{server.url}/club.aspx?id={tag}" for tag in range(24)]
+
+    start = time.monotonic()
+    serial = make_crawler(server, max_concurrency=1)
+    for url in urls:
+        serial.fetch(url)
+    serial_elapsed = time.monotonic() - start
+
+    start = time.monotonic()
+    make_crawler(server, max_concurrency=8, max_per_host_concurrency=8).fetch_all(urls)
+    concurrent_elapsed = time.monotonic() - start
+
+    print(
+        f"{len(urls)} pages: {serial_elapsed:.2f}s in turn, {concurrent_elapsed:.2f}s"
+    )
+    assert concurrent_elapsed * 3 < serial_elapsed
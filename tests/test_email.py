@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from app.email_body import EmailBody, FragmentCache
+from app.event import Event
+from app.outbox import Outbox
+from tests.gmail import FakeGmail
+
+
+def make_event(i):
+    data = {field: f"{field} {i}" for field in Event.FIELDS}
+    data["event_type"] = "venue"
+    data["tickets"] = [{"name": "Early bird", "price": "£10"}]
+    return Event.from_dict(data)
+
+
+def render(events):
+    fragments = FragmentCache()
+    body = EmailBody("A")
+    for event in events:
+        body.add_fragment(fragments.get(event))
+    body.add_ending("Club", "DJ", "Promoter", "London")
+    return body.get()
+
+
+def concatenated(events):
+    # The email body as it was built before, one string copy per event.
+    message = "Hi <b>A,</b> <br><br><br>"
+    for event in events:
+        message += EmailBody.render_event(event)
+    ending = EmailBody("A")
+    ending.parts = []
+    ending.add_ending("Club", "DJ", "Promoter", "London")
+    return message + ending.get()
+
+
+@pytest.mark.parametrize(
+    "count", [1000, pytest.param(20000, marks=pytest.mark.slow)]
+)
+def test_render_digest(count):
+    events = [make_event(i) for i in range(count)]
+
+    start = time.monotonic()
+    body = render(events)
+    elapsed = time.monotonic() - start
+
+    print(f"{count} events rendered in {elapsed * 1000:.1f}ms, {len(body)} chars")
+    assert body == concatenated(events)
+
+
+def send_rate(db, gmail, count, batch_size, prefix):
+    outbox = Outbox(db, batch_size=batch_size)
+    for i in range(count):
+        outbox.enqueue(f"{prefix}{i}@x", "<p>news</p>" * 50)
+    db.commit()
+
+    start = time.monotonic()
+    outbox.drain(lambda: gmail)
+    return count / (time.monotonic() - start)
+
+
+@pytest.mark.parametrize("count", [200, pytest.param(2000, marks=pytest.mark.slow)])
+def test_batched_send_throughput(db, count):
+    # 5ms per round trip to Gmail, one per batch request.
+    gmail = FakeGmail(latency=0.005)
+
+    one_by_one = send_rate(db, gmail, count, 1, "single")
+    batched = send_rate(db, gmail, count, 50, "batched")
+
+    print(
+        f"{count} emails: {one_by_one:.0f}/s one request each, "
+        f"{batched:.0f}/s in batches of 50"
+    )
+    assert len(gmail.sent) == 2 * count
+    assert batched > 2 * one_by_one
@@ -0,0 +1,137 @@
+import pytest
+
+from app.app import App
+from app.config import Config
+from app.models import DBEvent
+from app.synthetic import SyntheticSite
+from tests.gmail import FakeGmail
+
+RA_CONFIG = {
+    "login_url": "https://www.residentadvisor.net/login",
+    "payload": {},
+    "profile_url_prefix": "https://www.residentadvisor.net/profile/",
+    "venue_url_prefix": "https://www.residentadvisor.net/club.aspx?id=",
+    "artist_url_prefix": "https://www.residentadvisor.net/dj/",
+    "promoter_url_prefix": "https://www.residentadvisor.net/promoter.aspx?id=",
+}
+
+
+@pytest.fixture
+def replay_config(tmp_path):
+    # Runs App.main against a synthetic site through the in-process
+    # ReplayAdapter, nothing leaves the machine.
+    def replay_config(users=5, database="database.db", **overrides):
+        config = dict(RA_CONFIG)
+        site = tmp_path / f"site{users}"
+        config["users_path"] = SyntheticSite(users=users).write(str(site), config)
+        config.update(
+            replay_dir=str(site),
+            database_url=f"sqlite:///{tmp_path}/{database}",
+            gmail_discovery_path=str(tmp_path / "gmail_discovery.json"),
+            checkpoint_batch_size=10,
+        )
+        config.update(overrides)
+        return config
+
+    return replay_config
+
+
+@pytest.fixture
+def other_gmail():
+    return FakeGmail()
+
+
+def run(config, gmail, shards=None):
+    app = App(Config(data=config))
+    app.make_service = lambda: gmail
+    app.main(shards)
+    return app
+
+
+def stored_events(app):
+    db = app.connect()
+    return {
+        (event.event_id, event.event_type, event.tickets_available)
+        for event in db.session.query(DBEvent)
+    }
+
+
+def test_main_notifies_users_of_new_events(replay_config, gmail):
+    app = run(replay_config(), gmail)
+
+    events = stored_events(app)
+    assert events
+    # Odd events have tickets on sale.
+    assert all(tickets == (int(event_id) % 2 == 1) for event_id, _, tickets in events)
+    assert gmail.sent
+    assert len({message["To"] for message in gmail.sent}) == len(gmail.sent)
+
+
+def test_a_second_run_finds_nothing_new(replay_config, gmail, tmp_path):
+    config = replay_config(http_cache_path=str(tmp_path / "http_cache.db"))
+    run(config, gmail)
+    sent = len(gmail.sent)
+
+    second = run(config, gmail)
+
+    assert len(gmail.sent) == sent
+    # Every page was recorded with an ETag and comes back as a 304.
+    stats = second.crawler.cache.stats()
+    assert stats["misses"] == 0
+    assert stats["hits"] > 0 and stats["bytes_saved"] > 0
+
+
+def test_main_survives_injected_failures(replay_config, gmail, other_gmail):
+    expected = stored_events(run(replay_config(), gmail))
+
+    config = replay_config(
+        database="flaky.db",
+        replay_error_rate=0.2,
+        http_max_tries=10,
+        http_backoff_base=0,
+    )
+    flaky = run(config, other_gmail)
+
+    assert stored_events(flaky) == expected
+    assert flaky.crawler.client.stats()["retries"] > 0
+    assert len(other_gmail.sent) == len(gmail.sent)
+
+
+def test_sharded_main_matches_a_single_process(
+    replay_config, gmail, other_gmail, tmp_path
+):
+    expected = stored_events(run(replay_config(), gmail))
+
+    config = replay_config(
+        database="sharded.db",
+        # Shared by the worker processes.
+        http_cache_path=str(tmp_path / "http_cache.db"),
+        crawl_workers=2,
+        shard_poll_interval=0.1,
+    )
+    sharded = run(config, other_gmail, shards=3)
+
+    assert stored_events(sharded) == expected
+    assert sorted(message["To"] for message in other_gmail.sent) == sorted(
+        message["To"] for message in gmail.sent
+    )
+
+
+def test_benchmark_reports_throughput(replay_config):
+    app = App(Config(data=replay_config(users=3)))
+
+    results = app.benchmark(2)
+
+    assert results["runs_per_second"] > 0
+    assert results["pages_per_run"] > 0
+    assert results["db_queries_per_run"] > 0
+
+
+@pytest.mark.slow
+def test_scaled_benchmark(replay_config):
+    app = App(Config(data=replay_config(users=SyntheticSite.scaled(10).users)))
+
+    results = app.benchmark(1)
+
+    print(results)
+    assert results["runs_per_second"] > 0
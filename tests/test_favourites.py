@@ -0,0 +1,97 @@
+import json
+
+from app.models import DBArtist, DBLocation, DBUser
+from app.user import User
+
+
+def follows(users):
+    return {
+        user.nickname: (user.artists, user.venues, user.promoters) for user in users
+    }
+
+
+def watch_updates(app, db):
+    # Nicknames of the users parsed and written by each preferences update.
+    parsed = []
+    written = []
+    parse_favourites = app.parse_favourites
+    update_users = db.update_users
+
+    def counted_parse(user, soup):
+        parsed.append(user.nickname)
+        return parse_favourites(user, soup)
+
+    def counted_update(users):
+        written.extend(user.nickname for user in users)
+        return update_users(users)
+
+    app.parse_favourites = counted_parse
+    db.update_users = counted_update
+    return parsed, written
+
+
+def test_unchanged_profiles_are_neither_parsed_nor_written(make_app):
+    app = make_app()
+    db = app.connect()
+    first = app.update_users_preferences(db)
+    parsed, written = watch_updates(app, db)
+
+    second = app.update_users_preferences(db)
+
+    assert parsed == written == []
+    # The follows stored by the first update are loaded instead.
+    assert follows(second) == follows(first)
+    assert all(user.artists for user in second)
+
+
+def test_changed_follows_are_synced(server, make_app):
+    app = make_app()
+    db = app.connect()
+    app.update_users_preferences(db)
+    parsed, written = watch_updates(app, db)
+    server.follows = 4
+
+    users = app.update_users_preferences(db)
+
+    assert parsed == written == ["a", "b"]
+    assert all(len(user.artists) == 4 for user in users)
+    assert db.session.query(DBArtist).count() == 8
+
+
+def test_changed_locations_are_synced(make_app, users_path):
+    app = make_app()
+    db = app.connect()
+    app.update_users_preferences(db)
+    parsed, written = watch_updates(app, db)
+    with open(users_path) as f:
+        data = json.load(f)
+    data["users"][0]["locations"] = ["Berlin"]
+    with open(users_path, "w") as f:
+        json.dump(data, f)
+
+    app.update_users_preferences(db)
+
+    assert parsed == written == ["a"]
+    user_a = db.session.query(DBUser).filter_by(nickname="a").one()
+    assert [
+        location.name
+        for location in db.session.query(DBLocation).filter_by(user_id=user_a.id)
+    ] == ["Berlin"]
+
+
+def test_only_the_follow_lists_are_digested(make_app):
+    app = make_app()
+    user = User("A", "a", "a@x", [])
+
+    def digest(link, ad="ad"):
+        html = (
+            f'<html><p>{ad}</p><div class="fav"><div class="pb2">{link}</div></div>'
+            "</html>"
+        )
+        return app.favourites_digest(user, app.parser.favourites(html))
+
+    plain = digest('<a href="/dj/x">X</a>')
+    assert digest('<a href="/dj/x">X</a>', ad="another ad") == plain
+    assert digest('<a href="/dj/x"><span>Y</span></a>') != plain
+    assert digest("<a href='/dj/y'>X</a>") != plain
+    assert digest('<a href="https://www.residentadvisor.net/dj/y">X</a>') != plain
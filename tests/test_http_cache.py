@@ -0,0 +1,66 @@
+from app.config import Config
+from app.crawler import Crawler
+from tests.site import listing_page
+
+
+def make_crawler(server, tmp_path, **overrides):
+    config = server.config(http_cache_path=str(tmp_path / "http_cache.db"))
+    config.update(overrides)
+    return Crawler.from_config(Config(data=config))
+
+
+def test_unchanged_pages_are_served_from_the_cache(server, tmp_path):
+    crawler = make_crawler(server, tmp_path)
+    url = f"{server.url}/dj/1"
+    page = listing_page("artist", "1")
+
+    assert crawler.fetch(url) == page
+    assert crawler.fetch(url) == page
+
+    assert server.hits["/dj/1"] == 2
+    assert crawler.cache.stats() == {
+        "hits": 1,
+        "misses": 1,
+        "bytes_saved": len(page.encode("utf-8")),
+    }
+
+
+def test_changed_pages_replace_the_cached_copy(server, tmp_path):
+    crawler = make_crawler(server, tmp_path)
+    url = f"{server.url}/dj/1"
+    crawler.fetch(url)
+    server.events = 8
+
+    page = crawler.fetch(url)
+
+    assert page == listing_page("artist", "1", 8)
+    assert crawler.cache.get(url).body == page
+    assert crawler.cache.stats()["misses"] == 2
+    assert crawler.cache.stats()["hits"] == 0
+
+
+def test_least_recently_used_pages_are_evicted(server, tmp_path):
+    size = len(listing_page("artist", "1").encode("utf-8"))
+    crawler = make_crawler(server, tmp_path, http_cache_max_bytes=int(size * 2.5))
+    first, second, third = (f"{server.url}/dj/{tag}" for tag in (1, 2, 3))
+    crawler.fetch(first)
+    crawler.fetch(second)
+    # Served from the cache, which makes it the most recently used.
+    crawler.fetch(first)
+
+    crawler.fetch(third)
+
+    assert crawler.cache.get(first) is not None
+    assert crawler.cache.get(second) is None
+    assert crawler.cache.get(third) is not None
+
+
+def test_only_successful_responses_are_stored(server, tmp_path):
+    crawler = make_crawler(server, tmp_path)
+    server.script("/dj/1", (404, {"ETag": '"missing"'}))
+    url = f"{server.url}/dj/1"
+
+    crawler.fetch(url)
+
+    assert crawler.cache.get(url) is None
+    assert crawler.cache.stats()["misses"] == 1
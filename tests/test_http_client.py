@@ -0,0 +1,104 @@
+import email.utils
+import time
+
+import pytest
+import requests
+
+from app.config import Config
+from app.crawler import Crawler
+from app.http_client import HttpClient
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Retry delays are recorded instead of waited for.
+    sleeps = []
+    monkeypatch.setattr("app.http_client.time.sleep", sleeps.append)
+    return sleeps
+
+
+def test_retries_throttled_requests(server, sleeps):
+    server.script("/dj/1", (429, {"Retry-After": "3"}), (503, {}))
+    client = HttpClient(backoff_base=1, backoff_max=60)
+
+    response = client.get(f"{server.url}/dj/1")
+
+    assert response.status_code == 200
+    assert server.hits["/dj/1"] == 3
+    assert sleeps[0] == 3
+    # Without Retry-After, full jitter up to the second attempt's backoff.
+    assert 0 <= sleeps[1] <= 2
+    assert client.stats()["retries"] == 2
+
+
+def test_honours_retry_after_dates(server, sleeps):
+    retry_at = email.utils.formatdate(time.time() + 30, usegmt=True)
+    server.script("/dj/1", (429, {"Retry-After": retry_at}))
+    client = HttpClient()
+
+    assert client.get(f"{server.url}/dj/1").status_code == 200
+    assert 28 <= sleeps[0] <= 30
+
+
+def test_retry_after_is_capped(server, sleeps):
+    server.script("/dj/1", (429, {"Retry-After": "3600"}))
+    client = HttpClient(backoff_max=60)
+
+    assert client.get(f"{server.url}/dj/1").status_code == 200
+    assert sleeps == [60]
+
+
+def test_gives_up_after_max_tries(server, sleeps):
+    server.script("/dj/1", *[(503, {})] * 5)
+    client = HttpClient(max_tries=3)
+
+    response = client.get(f"{server.url}/dj/1")
+
+    # The last failure is returned for the caller to handle.
+    assert response.status_code == 503
+    assert server.hits["/dj/1"] == 3
+    assert len(sleeps) == 2
+
+
+def test_gives_up_on_connection_errors_after_max_tries(server, sleeps):
+    url = f"{server.url}/dj/1"
+    server.stop()
+    client = HttpClient(max_tries=3)
+
+    with pytest.raises(requests.ConnectionError):
+        client.get(url)
+
+    assert len(sleeps) == 2
+
+
+def test_pooled_requests_reuse_connections(server):
+    server.handshake = 0.01
+    urls = [f"{server.url}/dj/{tag}" for tag in range(20)]
+    client = HttpClient()
+
+    start = time.monotonic()
+    for url in urls:
+        client.get(url)
+    pooled = time.monotonic() - start
+    pooled_connections = server.connections
+
+    start = time.monotonic()
+    for url in urls:
+        requests.get(url)
+    unpooled = time.monotonic() - start
+
+    print(f"{len(urls)} pages: {pooled:.3f}s pooled, {unpooled:.3f}s unpooled")
+    # One handshake instead of one per page.
+    assert pooled_connections == 1
+    assert server.connections - pooled_connections == len(urls)
+
+
+def test_concurrent_fetches_keep_a_connection_per_worker(server):
+    server.latency = 0.02
+    crawler = Crawler.from_config(
+        Config(data=server.config(max_concurrency=4, max_per_host_concurrency=4))
+    )
+
+    crawler.fetch_all([f"{server.url}/dj/{tag}" for tag in range(40)])
+
+    assert server.connections <= 4
@@ -0,0 +1,64 @@
+import gc
+import tracemalloc
+
+from app.app import App
+from app.config import Config
+from app.event import Event
+from tests.test_parser import fixture
+
+VENUE = {"type": "venue", "tag": "1", "name": "Club 1"}
+
+
+def crawl_peak(app, pages):
+    # Peak traced memory while parsing a crawl's worth of listing pages
+    # beyond the events kept at the end, as the crawl keeps them.
+    html = fixture("listing.html")
+    gc.collect()
+    tracemalloc.start()
+    try:
+        events = []
+        for _ in range(pages):
+            events.extend(app.parse_events(VENUE, html))
+        peak = tracemalloc.get_traced_memory()[1]
+        gc.collect()
+        return peak - tracemalloc.get_traced_memory()[0], len(events)
+    finally:
+        tracemalloc.stop()
+
+
+def test_peak_memory_stays_flat_across_pages():
+    app = App(Config(data={}))
+    crawl_peak(app, 1)
+
+    one_page, _ = crawl_peak(app, 1)
+    many_pages, events = crawl_peak(app, 20)
+
+    print(
+        f"peak over the kept events {one_page / 1024:.0f}KiB for 1 page, "
+        f"{many_pages / 1024:.0f}KiB for 20 pages and {events} events"
+    )
+    assert events == 600
+    # Never more than one page's tree is alive.
+    assert many_pages < one_page * 1.5
+
+
+def test_events_are_slotted_and_interned():
+    data = {field: f"{field} value" for field in Event.FIELDS}
+    data["event_type"] = "venue"
+    # Built from separate strings, as every parsed page produces them anew.
+    first = Event.from_dict({key: "".join(value) for key, value in data.items()})
+    second = Event.from_dict({key: "".join(value) for key, value in data.items()})
+
+    assert not hasattr(first, "__dict__")
+    assert first.venue is second.venue
+    assert first.event_type is second.event_type
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        events = [Event.from_dict(first.to_dict()) for _ in range(1000)]
+        per_event = (tracemalloc.get_traced_memory()[0] - before) / len(events)
+    finally:
+        tracemalloc.stop()
+    print(f"{per_event:.0f} bytes per event")
+    assert per_event < 400
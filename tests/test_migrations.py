@@ -0,0 +1,103 @@
+import sqlite3
+import time
+
+import pytest
+
+from app.database import Database
+from app.migrations import Migrator
+from app.models import DBArtist, DBEvent, DBUser
+
+# The schema before the migrator, without indexes or constraints.
+LEGACY_SCHEMA = """
+CREATE TABLE users (id INTEGER PRIMARY KEY, name VARCHAR(50),
+    nickname VARCHAR(50), email VARCHAR(50));
+CREATE TABLE locations (id INTEGER PRIMARY KEY, name VARCHAR(50),
+    user_id INTEGER REFERENCES users (id));
+CREATE TABLE artists (id INTEGER PRIMARY KEY, name VARCHAR(50), tag VARCHAR(50),
+    user_id INTEGER REFERENCES users (id));
+CREATE TABLE venues (id INTEGER PRIMARY KEY, name VARCHAR(50), tag VARCHAR(50),
+    user_id INTEGER REFERENCES users (id));
+CREATE TABLE promoters (id INTEGER PRIMARY KEY, name VARCHAR(50), tag VARCHAR(50),
+    user_id INTEGER REFERENCES users (id));
+CREATE TABLE venueevents (id INTEGER PRIMARY KEY, event_id VARCHAR(50),
+    event_type VARCHAR(10), tickets_available BOOLEAN);
+"""
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    path = tmp_path / "legacy.db"
+    connection = sqlite3.connect(path)
+    connection.executescript(LEGACY_SCHEMA)
+    connection.executescript("""
+        INSERT INTO users VALUES (1, 'A', 'a', 'a@x'), (2, 'A', 'a', 'a@x'),
+            (3, 'B', 'b', 'b@x');
+        INSERT INTO artists VALUES (1, 'DJ 1', 'dj1', 1), (2, 'DJ 1', 'dj1', 2),
+            (3, 'DJ 2', 'dj2', 3);
+        INSERT INTO venueevents VALUES (1, '1000001', 'venue', 0),
+            (2, '1000001', 'venue', 1), (3, '1000001', 'artist', NULL),
+            (4, '1000001', 'artist', 0), (5, '1000002', 'venue', 0);
+        """)
+    connection.commit()
+    connection.close()
+    return f"sqlite:///{path}"
+
+
+def test_upgrade_keeps_events_with_tickets(legacy_db):
+    db = Database.from_url(legacy_db)
+
+    events = {
+        (event.event_id, event.event_type): (event.id, event.tickets_available)
+        for event in db.session.query(DBEvent)
+    }
+    assert events == {
+        ("1000001", "venue"): (2, True),
+        ("1000001", "artist"): (3, None),
+        ("1000002", "venue"): (5, False),
+    }
+
+
+def test_upgrade_removes_the_follows_of_duplicate_users(legacy_db):
+    db = Database.from_url(legacy_db)
+
+    assert [user.id for user in db.session.query(DBUser).order_by(DBUser.id)] == [1, 3]
+    assert {(artist.user_id, artist.tag) for artist in db.session.query(DBArtist)} == {
+        (1, "dj1"),
+        (3, "dj2"),
+    }
+
+
+def test_upgrade_is_recorded(legacy_db):
+    db = Database.from_url(legacy_db)
+
+    with db.session.get_bind().connect() as connection:
+        assert Migrator(connection).current_version(connection) == (
+            Migrator.latest_version()
+        )
+
+
+@pytest.mark.parametrize(
+    "rows", [20_000, pytest.param(1_000_000, marks=pytest.mark.slow)]
+)
+def test_event_lookup_latency(tmp_path, rows):
+    db = Database.from_url(f"sqlite:///{tmp_path}/events.db")
+    for start in range(0, rows, 50_000):
+        db.session.execute(
+            DBEvent.__table__.insert(),
+            [
+                {"event_id": str(1000000 + i), "event_type": "venue"}
+                for i in range(start, min(start + 50_000, rows))
+            ],
+        )
+    db.commit()
+
+    # A listing's worth of events, half of them not stored yet.
+    keys = [(str(1000000 + rows - 25 + i), "venue") for i in range(50)]
+    start = time.perf_counter()
+    for _ in range(100):
+        found = db.fetch_events(keys)
+    elapsed = (time.perf_counter() - start) / 100
+
+    print(f"{rows} events: {elapsed * 1000:.2f}ms per lookup of {len(keys)} keys")
+    assert len(found) == 25
+    assert elapsed < 0.05
@@ -0,0 +1,102 @@
+import datetime
+
+from app.models import DBOutboxMessage
+from app.outbox import Outbox
+
+
+def messages(db):
+    return {
+        message.recipient: message
+        for message in db.session.query(DBOutboxMessage).order_by(DBOutboxMessage.id)
+    }
+
+
+def test_enqueue_is_idempotent(db):
+    outbox = Outbox(db)
+
+    outbox.enqueue("a@x", "<p>news</p>")
+    outbox.enqueue("a@x", "<p>news</p>")
+    outbox.enqueue("a@x", "<p>more news</p>")
+    db.commit()
+
+    assert db.session.query(DBOutboxMessage).count() == 2
+
+
+def test_messages_go_out_in_batches(db, gmail):
+    outbox = Outbox(db, batch_size=2)
+    for i in range(5):
+        outbox.enqueue(f"user{i}@x", "<p>news</p>")
+    db.commit()
+
+    outbox.drain(lambda: gmail)
+
+    assert gmail.batches == [2, 2, 1]
+    assert [message["To"] for message in gmail.sent] == [f"user{i}@x" for i in range(5)]
+    assert {message.status for message in messages(db).values()} == {"sent"}
+
+
+def test_failed_messages_of_a_batch_are_rescheduled(db, gmail):
+    gmail.fail["b@x"] = 1
+    outbox = Outbox(db, retry_delay=60)
+    for recipient in ("a@x", "b@x", "c@x"):
+        outbox.enqueue(recipient, "<p>news</p>")
+    db.commit()
+
+    before = datetime.datetime.utcnow()
+    outbox.drain(lambda: gmail)
+
+    stored = messages(db)
+    assert [message["To"] for message in gmail.sent] == ["a@x", "c@x"]
+    assert stored["a@x"].status == stored["c@x"].status == "sent"
+    failed = stored["b@x"]
+    assert (failed.status, failed.attempts, failed.claimed_by) == ("pending", 1, None)
+    assert failed.last_error == "Rejected b@x"
+    # Full jitter up to retry_delay * 2 ** attempts.
+    assert before <= failed.next_attempt_at <= before + datetime.timedelta(seconds=121)
+
+
+def test_rescheduled_messages_wait_until_they_are_due(db, gmail):
+    gmail.fail["a@x"] = 1
+    outbox = Outbox(db, retry_delay=3600)
+    outbox.enqueue("a@x", "<p>news</p>")
+    db.commit()
+    outbox.drain(lambda: gmail)
+    message = messages(db)["a@x"]
+    # Pinned, the jittered delay could be anything up to two hours.
+    message.next_attempt_at = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+    db.commit()
+
+    outbox.drain(lambda: gmail)
+    assert gmail.batches == [1]
+
+    message.next_attempt_at = datetime.datetime.utcnow()
+    db.commit()
+    outbox.drain(lambda: gmail)
+
+    assert gmail.batches == [1, 1]
+    assert messages(db)["a@x"].status == "sent"
+
+
+def test_messages_fail_after_max_tries(db, gmail):
+    gmail.fail["a@x"] = 10
+    outbox = Outbox(db, max_tries=3, retry_delay=0)
+    outbox.enqueue("a@x", "<p>news</p>")
+    outbox.enqueue("b@x", "<p>news</p>")
+    db.commit()
+
+    outbox.drain(lambda: gmail)
+
+    message = messages(db)["a@x"]
+    assert (message.status, message.attempts) == ("failed", 3)
+    assert gmail.fail["a@x"] == 7
+    assert db.count_failed_messages() == 1
+    # Failed messages are not claimed again.
+    outbox.drain(lambda: gmail)
+    assert gmail.fail["a@x"] == 7
+
+
+def test_no_service_is_built_without_due_messages(db):
+    def make_service():
+        raise AssertionError("no message is due")
+
+    Outbox(db).drain(make_service)
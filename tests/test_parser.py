@@ -0,0 +1,88 @@
+import importlib.util
+import os
+import time
+
+import pytest
+
+from app.app import App
+from app.config import Config
+from app.parser import Parser
+from app.user import User
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+BACKENDS = [
+    "html.parser",
+    pytest.param(
+        "lxml",
+        marks=pytest.mark.skipif(
+            importlib.util.find_spec("lxml") is None, reason="lxml is not installed"
+        ),
+    ),
+]
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+class FullParser(Parser):
+    # The parser as it was before the strainers, building the whole page.
+    def events(self, html):
+        return self.parse(html).find_all("article", class_="event-item")
+
+    def tickets(self, html):
+        return self.parse(html).find_all("li", class_="onsale but")
+
+    def favourites(self, html):
+        return self.parse(html)
+
+
+def scrape(parser):
+    app = App(Config(data={}))
+    app.parser = parser
+
+    events = {}
+    for entity_type in ("venue", "artist", "promoter"):
+        entity = {"type": entity_type, "name": "Club 1"}
+        listing = fixture("listing.html")
+        events[entity_type] = [
+            event.to_dict() for event in app.parse_events(entity, listing)
+        ]
+
+    tickets = app.parse_tickets("event", fixture("event.html"))
+
+    user = User("A", "a", "a@x", [])
+    app.parse_favourites(user, parser.favourites(fixture("profile.html")))
+    follows = (user.artists, user.venues, user.promoters)
+
+    return events, tickets, follows
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_strained_parse_matches_full_parse(backend):
+    strained = scrape(Parser(backend))
+    full = scrape(FullParser(backend))
+
+    assert strained == full
+    events, tickets, follows = strained
+    assert all(len(found) == 30 for found in events.values())
+    assert [ticket["name"] for ticket in tickets] == ["Early bird ", "Second release "]
+    assert all(len(followed) == 12 for followed in follows)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_strained_parse_is_faster(backend):
+    html = fixture("listing.html")
+    timings = {}
+    for parser in (Parser(backend), FullParser(backend)):
+        start = time.perf_counter()
+        for _ in range(20):
+            list(parser.events(html))
+        timings[type(parser).__name__] = (time.perf_counter() - start) / 20
+
+    print(
+        f"{backend}: strained {timings['Parser'] * 1000:.1f}ms, "
+        f"full {timings['FullParser'] * 1000:.1f}ms per listing"
+    )
+    assert timings["Parser"] < timings["FullParser"]
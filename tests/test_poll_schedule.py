@@ -0,0 +1,64 @@
+import pytest
+
+from app.poll_schedule import PollSchedule
+
+CLUB = {"type": "venue", "tag": "1", "name": "Club 1"}
+DJ = {"type": "artist", "tag": "dj1", "name": "DJ 1"}
+
+
+@pytest.fixture
+def no_jitter(monkeypatch):
+    monkeypatch.setattr("app.poll_schedule.random.uniform", lambda low, high: 1)
+
+
+def test_new_entities_are_due_at_once():
+    schedule = PollSchedule()
+
+    assert schedule.due([CLUB, DJ], 0) == [CLUB, DJ]
+
+
+def test_unchanged_entities_back_off_up_to_the_maximum(no_jitter):
+    schedule = PollSchedule(min_interval=100, max_interval=500, backoff=2)
+
+    intervals = []
+    for now in range(6):
+        schedule.record(CLUB, False, now)
+        intervals.append(schedule.intervals[("venue", "1")])
+
+    assert intervals == [100, 200, 400, 500, 500, 500]
+    assert schedule.next_checks[("venue", "1")] == 5 + 500
+
+
+def test_a_change_resets_the_interval(no_jitter):
+    schedule = PollSchedule(min_interval=100, max_interval=500, backoff=2)
+    for now in range(3):
+        schedule.record(CLUB, False, now)
+
+    schedule.record(CLUB, True, 10)
+
+    assert schedule.intervals[("venue", "1")] == 100
+    assert schedule.due([CLUB], 109) == []
+    assert schedule.due([CLUB], 110) == [CLUB]
+
+
+def test_next_checks_are_jittered():
+    schedule = PollSchedule(min_interval=100)
+
+    checks = set()
+    for i in range(50):
+        entity = {"type": "artist", "tag": str(i), "name": str(i)}
+        schedule.record(entity, True, 0)
+        checks.add(schedule.next_checks[("artist", str(i))])
+
+    assert all(90 <= check <= 110 for check in checks)
+    assert len(checks) > 1
+
+
+def test_next_check_is_the_earliest_entity(no_jitter):
+    schedule = PollSchedule(min_interval=100, max_interval=500, backoff=2)
+    schedule.record(CLUB, False, 0)
+    schedule.record(CLUB, False, 0)
+    schedule.record(DJ, True, 0)
+
+    assert schedule.next_check([CLUB, DJ], 0) == 100
+    assert schedule.next_check([], 0) == 100
@@ -0,0 +1,79 @@
+import datetime
+import sqlite3
+
+from app.models import DBEvent
+
+TODAY = datetime.date.today()
+NOW = datetime.datetime.utcnow()
+
+
+def add_event(db, event_id, event_date, last_seen):
+    db.add_events(
+        [
+            {
+                "event_id": event_id,
+                "event_type": "venue",
+                "tickets_available": False,
+                "event_date": event_date,
+                "last_seen": last_seen,
+            }
+        ]
+    )
+
+
+def stored_ids(db):
+    return {event.event_id for event in db.session.query(DBEvent)}
+
+
+def test_prune_removes_past_and_long_unseen_events(db):
+    long_ago = NOW - datetime.timedelta(days=60)
+    add_event(db, "past", TODAY - datetime.timedelta(days=3), long_ago)
+    add_event(db, "future", TODAY + datetime.timedelta(days=3), long_ago)
+    add_event(db, "undated", None, long_ago)
+    add_event(db, "undated but listed", None, NOW)
+    db.commit()
+
+    pruned = db.prune_events(TODAY, NOW - datetime.timedelta(days=30))
+
+    assert pruned == 2
+    assert stored_ids(db) == {"future", "undated but listed"}
+
+
+def test_prune_keeps_past_events_that_are_still_listed(db):
+    # Seen by today's crawl, e.g. a festival that started yesterday. Pruned,
+    # the next crawl would store and notify it as new.
+    add_event(db, "festival", TODAY - datetime.timedelta(days=1), NOW)
+    db.commit()
+
+    assert db.prune_events(TODAY, NOW - datetime.timedelta(days=30)) == 0
+    assert stored_ids(db) == {"festival"}
+
+
+def test_prune_deletes_in_batches(db):
+    db.BATCH_SIZE = 3
+    long_ago = NOW - datetime.timedelta(days=60)
+    for i in range(10):
+        add_event(db, str(i), TODAY - datetime.timedelta(days=3), long_ago)
+    db.commit()
+
+    assert db.prune_events(TODAY, NOW) == 10
+    assert stored_ids(db) == set()
+
+
+def test_vacuum_compacts_the_database(tmp_path, make_app):
+    app = make_app(prune_grace_days=0)
+    db = app.connect()
+    long_ago = NOW - datetime.timedelta(days=60)
+    for i in range(2000):
+        add_event(db, str(i), TODAY - datetime.timedelta(days=3), long_ago)
+    db.commit()
+    path = tmp_path / "database.db"
+    size = path.stat().st_size
+
+    app.prune(vacuum=True)
+
+    assert stored_ids(app.connect()) == set()
+    assert path.stat().st_size < size
+    connection = sqlite3.connect(path)
+    assert connection.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    connection.close()
@@ -0,0 +1,215 @@
+import time
+
+import pytest
+
+from app.config import Config
+from app.crawler import Crawler
+from app.rate_limiter import RateLimiter, TokenBucket, schedule
+
+URL = "http://a.example/dj/1"
+
+
+class FakeClock:
+    # Sleeping moves the clock on at once, so timings are exact. Like a real
+    # sleep it always takes a little time, however short the wait.
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += max(seconds, 1e-6)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr("app.rate_limiter.time", clock)
+    return clock
+
+
+def test_token_bucket_allows_a_burst_then_the_rate(clock):
+    bucket = TokenBucket(rate=20, burst=5)
+
+    for _ in range(5):
+        bucket.acquire()
+    assert clock.now == 0
+    for _ in range(10):
+        bucket.acquire()
+
+    assert clock.now == pytest.approx(0.5, abs=1e-3)
+
+
+def test_token_bucket_refills_up_to_the_burst(clock):
+    bucket = TokenBucket(rate=100, burst=3)
+    for _ in range(3):
+        bucket.acquire()
+
+    clock.sleep(0.2)
+    bucket.refill()
+
+    assert bucket.tokens == 3
+
+
+@pytest.mark.parametrize("status_code, latency", [(429, 0.1), (503, 0.1), (None, 0.1)])
+def test_failures_halve_the_rate(status_code, latency):
+    limiter = RateLimiter(rate=8, min_rate=0.5, latency_threshold=5)
+
+    limiter.feedback(URL, status_code, latency)
+
+    assert limiter.rates() == {"a.example": 4}
+
+
+def test_slow_responses_halve_the_rate():
+    limiter = RateLimiter(rate=8, latency_threshold=5)
+
+    limiter.feedback(URL, 200, 6)
+
+    assert limiter.rates() == {"a.example": 4}
+
+
+def test_rate_never_drops_below_the_minimum():
+    limiter = RateLimiter(rate=1, min_rate=0.5)
+
+    for _ in range(5):
+        limiter.feedback(URL, 429, 0.1)
+
+    assert limiter.rates() == {"a.example": 0.5}
+
+
+def test_healthy_responses_win_the_rate_back_slowly():
+    limiter = RateLimiter(rate=4, max_rate=5)
+    limiter.feedback(URL, 429, 0.1)
+
+    for _ in range(10):
+        limiter.feedback(URL, 200, 0.1)
+    assert limiter.rates()["a.example"] == pytest.approx(3)
+
+    for _ in range(30):
+        limiter.feedback(URL, 200, 0.1)
+    assert limiter.rates()["a.example"] == 5
+
+
+def test_hosts_are_limited_separately():
+    limiter = RateLimiter(rate=4)
+
+    limiter.feedback(URL, 429, 0.1)
+    limiter.feedback("http://b.example/dj/1", 200, 0.1)
+
+    assert limiter.rates() == {"a.example": 2, "b.example": pytest.approx(4.1)}
+
+
+def test_schedule_round_robins_over_hosts():
+    urls = [
+        "http://a.example/1",
+        "http://a.example/2",
+        "http://a.example/3",
+        "http://b.example/1",
+        "http://c.example/1",
+        "http://c.example/2",
+    ]
+
+    order = schedule(urls)
+
+    assert [urls[i] for i in order] == [
+        "http://a.example/1",
+        "http://b.example/1",
+        "http://c.example/1",
+        "http://a.example/2",
+        "http://c.example/2",
+        "http://a.example/3",
+    ]
+
+
+def test_schedule_keeps_the_order_of_a_single_host():
+    urls = [f"http://a.example/{i}" for i in range(5)]
+
+    assert schedule(urls) == [0, 1, 2, 3, 4]
+    assert schedule([]) == []
+
+
+def limited_crawler(server, **overrides):
+    config = server.config(
+        rate_limit_per_host=40,
+        rate_limit_burst=1,
+        rate_limit_min=1,
+        rate_limit_max=40,
+        http_backoff_base=0,
+    )
+    config.update(overrides)
+    return Crawler.from_config(Config(data=config))
+
+
+def timed_fetch_all(crawler, urls):
+    start = time.monotonic()
+    pages = crawler.fetch_all(urls)
+    elapsed = time.monotonic() - start
+    return pages, len(urls) / elapsed
+
+
+def test_fetch_all_slows_down_on_429s_and_recovers(server, monkeypatch):
+    # Recovers in tens of pages instead of hundreds.
+    monkeypatch.setattr(RateLimiter, "INCREASE_STEP", 1)
+    crawler = limited_crawler(server)
+    host = server.url[len("http://") :]
+    urls = [f"{server.url}/dj/{tag}" for tag in range(20)]
+    healthy, healthy_rate = timed_fetch_all(crawler, urls)
+
+    for tag in range(3):
+        server.script(f"/dj/{tag}", (429, {}))
+    throttled, throttled_rate = timed_fetch_all(crawler, urls)
+    slowest = crawler.client.rate_limiter.rates()[host]
+    assert slowest < 40
+
+    recovered, recovered_rate = timed_fetch_all(crawler, urls * 2)
+
+    print(
+        f"pages/s: {healthy_rate:.0f} healthy, {throttled_rate:.0f} after 429s, "
+        f"{recovered_rate:.0f} recovered"
+    )
+    # Every throttled page was retried, none came back as the 429.
+    assert throttled == healthy == recovered[: len(urls)]
+    assert crawler.client.stats()["retries"] == 3
+    assert crawler.client.rate_limiter.rates()[host] == 40
+
+
+def test_429s_from_one_host_do_not_slow_down_another(server):
+    crawler = limited_crawler(server)
+    throttled_host = f"127.0.0.1:{server.server_address[1]}"
+    healthy_host = f"localhost:{server.server_address[1]}"
+    for tag in range(5):
+        server.script(f"/dj/{tag}", (429, {}))
+    urls = [
+        url
+        for tag in range(5)
+        for url in (
+            f"http://{throttled_host}/dj/{tag}",
+            f"http://{healthy_host}/club.aspx?id={tag}",
+        )
+    ]
+
+    pages = crawler.fetch_all(urls)
+
+    assert all(pages)
+    rates = crawler.client.rate_limiter.rates()
+    assert rates[throttled_host] < 40
+    assert rates[healthy_host] == 40
+
+
+def test_local_workers_split_the_budget():
+    config = Config(
+        data={
+            "rate_limit_per_host": 8,
+            "rate_limit_burst": 6,
+            "rate_limit_min": 1,
+            "rate_limit_max": 20,
+            "local_workers": 4,
+        }
+    )
+
+    limiter = RateLimiter.from_config(config)
+
+    assert (limiter.rate, limiter.burst) == (2, 1.5)
+    assert (limiter.min_rate, limiter.max_rate) == (0.25, 5)
+    assert Crawler.from_config(config).max_per_host == 1
@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only loaded once a run parses pages or sends emails.
+DEFERRED = [
+    "backoff",
+    "bs4",
+    "google.oauth2",
+    "googleapiclient",
+    "lxml",
+    "sqlalchemy_utils",
+]
+
+
+def import_times(module):
+    # Microseconds each module took to import, itself included, as reported
+    # by python -X importtime in a fresh interpreter.
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_heavy_imports_are_deferred():
+    times = import_times("app.app")
+
+    loaded = [
+        name
+        for name in times
+        if any(name == heavy or name.startswith(f"{heavy}.") for heavy in DEFERRED)
+    ]
+    assert loaded == []
+
+
+def test_import_time():
+    times = import_times("app.app")
+
+    slowest = sorted(times.items(), key=lambda item: item[1], reverse=True)[1:6]
+    print(
+        f"import app.app: {times['app.app'] / 1000:.0f}ms, slowest: "
+        + ", ".join(f"{name} {time / 1000:.0f}ms" for name, time in slowest)
+    )
+    # Several times the usual ~250ms, only a newly eager heavy import gets
+    # near it.
+    assert times["app.app"] < 1_500_000
+
+
+def test_config_is_not_read_on_import(tmp_path):
+    # No config.json in the working directory.
+    subprocess.run(
+        [sys.executable, "-c", "import app.app"],
+        cwd=tmp_path,
+        env=dict(os.environ, PYTHONPATH=ROOT),
+        check=True,
+    )
@@ -0,0 +1,119 @@
+import random
+import time
+
+import pytest
+
+from app.event import Event
+from app.subscriptions import SubscriptionIndex
+from app.user import User
+
+# Overlapping locations, a user in "Lon" also hears about London.
+LOCATIONS = ["London", "Lon", "don", "Berlin", "Berlin Mitte", "Paris", "Ibiza"]
+VENUES = [
+    "Fabric, London",
+    "Printworks, London",
+    "Berghain, Berlin Mitte",
+    "Tresor, Berlin",
+    "Rex Club, Paris",
+    "Amnesia, Ibiza",
+    "Output, New York",
+]
+
+
+def matches(user, event):
+    # The routing User.add_to_email did before SubscriptionIndex, for one
+    # user at a time.
+    if event.event_type == "venue":
+        return any(venue["name"] == event.venue for venue in user.venues)
+    if event.event_type == "artist":
+        if not any(artist["name"] == event.artist for artist in user.artists):
+            return False
+        if not user.locations:
+            return True
+        return any(location in event.venue for location in user.locations)
+    if event.event_type == "promoter":
+        return any(promoter["name"] == event.promoter for promoter in user.promoters)
+    return False
+
+
+def make_users(rng, users, follows, names):
+    result = []
+    for i in range(users):
+        user = User(f"User {i}", f"user{i}", f"user{i}@x", [])
+        # A third of the users have no location preference.
+        if rng.random() > 1 / 3:
+            user.locations = rng.sample(LOCATIONS, rng.randint(1, 3))
+        for _ in range(follows // users):
+            name = rng.choice(names)
+            getattr(user, rng.choice(["add_artist", "add_venue", "add_promoter"]))(
+                name, name
+            )
+        result.append(user)
+    return result
+
+
+def make_events(rng, events, names):
+    result = []
+    for i in range(events):
+        event_type = rng.choice(["venue", "artist", "promoter"])
+        venue = rng.choice(VENUES)
+        name = rng.choice(names + ["Nobody"])
+        result.append(
+            Event(
+                f"Night {i}",
+                name if event_type == "venue" else venue,
+                "",
+                "Sat, 1 Jun 2030",
+                name if event_type == "promoter" else "",
+                name if event_type == "artist" else "",
+                str(1000000 + i),
+                "",
+                event_type,
+            )
+        )
+    return result
+
+
+def test_index_routes_events_like_add_to_email():
+    rng = random.Random(12)
+    names = VENUES + [f"DJ {i}" for i in range(30)] + [f"Crew {i}" for i in range(10)]
+    users = make_users(rng, 300, 3000, names)
+    events = make_events(rng, 2000, names)
+    index = SubscriptionIndex(users)
+
+    notified = 0
+    for event in events:
+        expected = [user for user in users if matches(user, event)]
+        assert index.get(event) == expected
+        notified += len(expected)
+    assert notified
+
+
+@pytest.mark.parametrize(
+    "users, follows",
+    [(1000, 5000), pytest.param(10_000, 50_000, marks=pytest.mark.slow)],
+)
+def test_routing_benchmark(users, follows):
+    rng = random.Random(7)
+    names = [f"Name {i}" for i in range(follows // 10)]
+    users = make_users(rng, users, follows, names)
+    events = make_events(rng, 2000, names)
+
+    start = time.perf_counter()
+    index = SubscriptionIndex(users)
+    for event in events:
+        index.get(event)
+    indexed = time.perf_counter() - start
+
+    # The per-user scan is only timed on a sample of the events.
+    sample = events[:100]
+    start = time.perf_counter()
+    for event in sample:
+        [user for user in users if matches(user, event)]
+    scanned = (time.perf_counter() - start) * len(events) / len(sample)
+
+    print(
+        f"{len(users)} users, {follows} follows, {len(events)} events: "
+        f"index {indexed:.3f}s, per-user scan about {scanned:.1f}s"
+    )
+    assert indexed * 10 < scanned
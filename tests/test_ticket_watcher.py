@@ -0,0 +1,106 @@
+import datetime
+import json
+import random
+
+from app import synthetic
+from app.models import DBEvent
+from app.ticket_watcher import TicketWatcher
+
+NOW = datetime.datetime(2030, 6, 1, 12)
+
+
+def add_events(db, count, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        rows.append(
+            {
+                "event_id": str(1000000 + i),
+                "event_type": "venue",
+                "tickets_available": rng.random() < 0.2,
+                "event_date": rng.choice(
+                    [None, NOW.date() + datetime.timedelta(days=rng.randint(-5, 60))]
+                ),
+                # Distinct times, so that no two events are equally overdue.
+                "last_checked": rng.choice(
+                    [None, NOW - datetime.timedelta(microseconds=rng.randint(0, 10**11))]
+                ),
+                "payload": json.dumps({"event_id": str(1000000 + i)}),
+            }
+        )
+    db.add_events(rows)
+    db.commit()
+
+
+def watched_events(db, watcher):
+    candidates = []
+    for window in watcher.windows(NOW):
+        candidates.extend(db.pending_ticket_events(*window, watcher.batch_size))
+    return candidates
+
+
+def test_windows_find_the_same_events_as_ranking_every_pending_event(db):
+    add_events(db, 3000)
+    watcher = TicketWatcher(batch_size=50)
+    pending = (
+        db.session.query(DBEvent)
+        .filter(
+            DBEvent.tickets_available.isnot(True),
+            (DBEvent.event_date.is_(None)) | (DBEvent.event_date >= NOW.date()),
+        )
+        .all()
+    )
+
+    candidates = watched_events(db, watcher)
+
+    expected = [event.id for event in watcher.due(pending, NOW)]
+    assert len(expected) == 50
+    assert [event.id for event in watcher.due(candidates, NOW)] == expected
+    # A window's events past its batch are never loaded.
+    assert len(candidates) < len(pending)
+
+
+def test_windows_cover_every_interval():
+    watcher = TicketWatcher(min_interval=600, max_interval=3000)
+
+    windows = list(watcher.windows(NOW))
+
+    today = NOW.date()
+    assert [(first, last) for first, last, _ in windows] == [
+        (today, today),
+        (today + datetime.timedelta(days=1), today + datetime.timedelta(days=1)),
+        (today + datetime.timedelta(days=2), today + datetime.timedelta(days=2)),
+        (today + datetime.timedelta(days=3), today + datetime.timedelta(days=3)),
+        (today + datetime.timedelta(days=4), None),
+        (None, None),
+    ]
+    assert [NOW - checked_before for _, _, checked_before in windows] == [
+        datetime.timedelta(seconds=seconds)
+        for seconds in (600, 1200, 1800, 2400, 3000, 3000)
+    ]
+
+
+def test_watch_tickets_notifies_when_tickets_go_on_sale(server, make_app):
+    app = make_app()
+    db = app.connect()
+    users = app.update_users_preferences(db)
+    app.crawl(db, [{"type": "venue", "tag": "1", "name": "Club 1"}], watched=True)
+    db.session.query(DBEvent).update({"last_checked": None})
+    db.commit()
+    waiting = [
+        event.event_id
+        for event in db.session.query(DBEvent).filter(
+            DBEvent.tickets_available.isnot(True)
+        )
+    ]
+    for event_id in waiting:
+        server.pages[f"/events/{event_id}"] = synthetic.event_page("1")
+
+    app.watch_tickets(db, users)
+
+    db.session.expire_all()
+    assert not db.session.query(DBEvent).filter(
+        DBEvent.tickets_available.isnot(True)
+    ).count()
+    # Both users follow the club.
+    assert [user.number_of_new_events for user in users] == [len(waiting)] * 2